@@ -1,14 +1,64 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Literal
 import json
+import os
+import time
+import random
+import threading
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices
+from database import (
+    transaction as transaction_scope,
+    StaleAccountError,
+    create_account,
+    write_account,
+    read_account,
+    read_account_names,
+    write_log,
+    write_balance,
+    write_strategy,
+    write_trade,
+    write_trades,
+    write_ledger,
+    write_portfolio_value,
+    read_portfolio_values,
+    read_transactions_page,
+)
+from ledger import Ledger, check_mode
+import clock
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+# The cost basis mode new accounts start in; rebuild_ledgers.py switches existing ones
+COST_BASIS_MODE = check_mode(os.getenv("COST_BASIS_MODE", "average").strip().lower())
+SUMMARY_TRANSACTIONS = int(os.getenv("ACCOUNT_SUMMARY_TRANSACTIONS", "5"))
+MAX_TRANSACTIONS_PAGE = 100
+# The fields of Account.report, which fields= can project to
+REPORT_FIELDS = (
+    "name",
+    "balance",
+    "strategy",
+    "holdings",
+    "transactions",
+    "transaction_count",
+    "portfolio_value_time_series",
+    "total_portfolio_value",
+    "total_profit_loss",
+    "realized_profit_loss",
+    "unrealized_profit_loss",
+)
+# The compact view for prompts and trade confirmations: no strategy (prompts carry it already),
+# no time series, and only the latest transactions, so its size doesn't grow with the account
+SUMMARY_FIELDS = tuple(
+    field for field in REPORT_FIELDS if field not in ("strategy", "portfolio_value_time_series")
+)
+ACCOUNT_WRITE_RETRIES = int(os.getenv("ACCOUNT_WRITE_RETRIES", "10"))
+ACCOUNT_RETRY_BACKOFF_SECONDS = float(os.getenv("ACCOUNT_RETRY_BACKOFF_SECONDS", "0.005"))
+
+_conflict_lock = threading.Lock()
+_conflict_stats = {"conflicts": 0, "retries": 0, "exhausted": 0}
 
 
 class Transaction(BaseModel):
@@ -25,6 +75,13 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    side: Literal["buy", "sell"]
+    symbol: str
+    quantity: int
+    rationale: str
+
+
 class Account(BaseModel):
     name: str
     balance: float
@@ -32,10 +89,21 @@ class Account(BaseModel):
     holdings: dict[str, int]
     transactions: list[Transaction]
     portfolio_value_time_series: list[tuple[str, float]]
+    ledger: Ledger = Field(default_factory=lambda: Ledger(mode=COST_BASIS_MODE))
+    # The stored row version this instance was read at; every write checks and advances it
+    version: int = 0
+    # How many transactions are stored, when get only loaded the latest of them
+    _transaction_count: int | None = PrivateAttr(default=None)
 
     @classmethod
-    def get(cls, name: str):
-        fields = read_account(name.lower())
+    def get(cls, name: str, transactions_limit: int | None = None):
+        """
+        Read the account, creating it if new. With transactions_limit, only the latest
+        transactions_limit transactions are loaded and no portfolio value time series: enough
+        to trade, report balances and holdings, or summarize, at a cost that doesn't grow with
+        the account's history. Such an account can't be saved or have its ledger rebuilt.
+        """
+        fields = read_account(name.lower(), transactions_limit)
         if not fields:
             fields = {
                 "name": name.lower(),
@@ -43,21 +111,49 @@ class Account(BaseModel):
                 "strategy": "",
                 "holdings": {},
                 "transactions": [],
-                "portfolio_value_time_series": []
+                "portfolio_value_time_series": [],
+                "ledger": Ledger(mode=COST_BASIS_MODE).model_dump(),
+                "version": 0,
             }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
+            if not create_account(name, fields):
+                return cls.get(name)  # another writer created it first
+        if not fields.get("ledger"):
+            if transactions_limit is not None:
+                return cls.get(name)  # rebuilding the missing ledger needs the whole history
+            fields.pop("ledger", None)
+            account = cls(**fields)
+            try:
+                account.rebuild_ledger()
+            except StaleAccountError:
+                return cls.get(name)  # another writer got there first, and wrote a ledger
+            return account
+        transaction_count = fields.pop("transaction_count", None)
+        account = cls(**fields)
+        account._transaction_count = transaction_count
+        return account
+
+    def _require_history(self):
+        if self._transaction_count is not None and self._transaction_count != len(self.transactions):
+            raise ValueError(f"Account {self.name} was read without its full history; read it in full first.")
+
+    def _record(self, transactions: list[Transaction]):
+        self.transactions.extend(transactions)
+        if self._transaction_count is not None:
+            self._transaction_count += len(transactions)
+
     def save(self):
-        write_account(self.name.lower(), self.model_dump())
+        self._require_history()
+        write_account(self.name.lower(), self.model_dump(exclude={"version"}), self.version)
+        self.version += 1
 
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
         self.transactions = []
+        self._transaction_count = None
         self.portfolio_value_time_series = []
+        self.ledger = Ledger(mode=self.ledger.mode)
         self.save()
 
     def deposit(self, amount: float):
@@ -66,7 +162,8 @@ class Account(BaseModel):
             raise ValueError("Deposit amount must be positive.")
         self.balance += amount
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
+        write_balance(self.name, self.balance, self.version)
+        self.version += 1
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
@@ -74,7 +171,8 @@ class Account(BaseModel):
             raise ValueError("Insufficient funds for withdrawal.")
         self.balance -= amount
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
+        write_balance(self.name, self.balance, self.version)
+        self.version += 1
 
     def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
@@ -89,16 +187,27 @@ class Account(BaseModel):
         
         # Update holdings
         self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
+        self._record([transaction])
         
+        self.ledger.apply(symbol, quantity, buy_price)
+
         # Update balance
         self.balance -= total_cost
-        self.save()
+        write_trade(
+            self.name,
+            self.balance,
+            symbol,
+            self.holdings[symbol],
+            transaction.model_dump(),
+            self.ledger.model_dump(),
+            self.version,
+        )
+        self.version += 1
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + self.summary()
 
     def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Sell shares of a stock if the user has enough shares. """
@@ -115,52 +224,189 @@ class Account(BaseModel):
         # If shares are completely sold, remove from holdings
         if self.holdings[symbol] == 0:
             del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
+        self._record([transaction])
+
+        self.ledger.apply(symbol, -quantity, sell_price)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
+        write_trade(
+            self.name,
+            self.balance,
+            symbol,
+            self.holdings.get(symbol, 0),
+            transaction.model_dump(),
+            self.ledger.model_dump(),
+            self.version,
+        )
+        self.version += 1
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + self.summary()
+
+    def execute_orders(self, orders: list[Order], all_or_nothing: bool = True) -> dict:
+        """
+        Execute a batch of orders against one price snapshot and record them in one write.
 
-    def calculate_portfolio_value(self):
+        Orders are checked in sequence against the cash and holdings the earlier orders leave,
+        so a sale can fund a later purchase. With all_or_nothing, any rejected order fails the
+        whole batch and nothing is traded; otherwise the rejected orders are skipped.
+        """
+        prices = get_share_prices([order.symbol for order in orders] + list(self.holdings))
+        balance = self.balance
+        holdings = dict(self.holdings)
+        accepted, rejected = [], []
+        for order in orders:
+            price = prices[order.symbol]
+            fill = price * (1 + SPREAD) if order.side == "buy" else price * (1 - SPREAD)
+            error = None
+            if order.quantity <= 0:
+                error = "Quantity must be positive"
+            elif price == 0:
+                error = f"Unrecognized symbol {order.symbol}"
+            elif order.side == "buy" and fill * order.quantity > balance:
+                error = "Insufficient funds"
+            elif order.side == "sell" and holdings.get(order.symbol, 0) < order.quantity:
+                error = "Not enough shares held"
+            if error:
+                rejected.append({**order.model_dump(exclude={"rationale"}), "error": error})
+                continue
+            quantity = order.quantity if order.side == "buy" else -order.quantity
+            balance -= fill * quantity
+            holdings[order.symbol] = holdings.get(order.symbol, 0) + quantity
+            accepted.append((order, quantity, fill))
+        if rejected and all_or_nothing:
+            raise ValueError(f"No orders executed; rejected: {json.dumps(rejected)}")
+
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        transactions = []
+        for order, quantity, fill in accepted:
+            transaction = Transaction(
+                symbol=order.symbol, quantity=quantity, price=fill, timestamp=timestamp, rationale=order.rationale
+            )
+            transactions.append(transaction)
+            self.ledger.apply(order.symbol, quantity, fill)
+        self._record(transactions)
+        self.balance = balance
+        self.holdings = {symbol: quantity for symbol, quantity in holdings.items() if quantity}
+        if accepted:
+            positions = {order.symbol: self.holdings.get(order.symbol, 0) for order, _, _ in accepted}
+            with transaction_scope():
+                write_trades(
+                    self.name,
+                    self.balance,
+                    positions,
+                    [transaction.model_dump() for transaction in transactions],
+                    self.ledger.model_dump(),
+                    self.version,
+                )
+                self.version += 1
+                write_log(self.name, "account", f"Executed {len(accepted)} of {len(orders)} orders")
+        return {
+            "executed": [
+                {"side": order.side, "symbol": order.symbol, "quantity": order.quantity, "price": round(fill, 4)}
+                for order, _, fill in accepted
+            ],
+            "rejected": rejected,
+            "balance": round(self.balance, 2),
+            "holdings": self.holdings,
+            "total_portfolio_value": round(self.calculate_portfolio_value(prices), 2),
+        }
+
+    def calculate_portfolio_value(self, prices: dict[str, float] | None = None):
         """ Calculate the total value of the user's portfolio. """
+        prices = prices or get_share_prices(self.holdings.keys())
         total_value = self.balance
         for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
+            total_value += prices[symbol] * quantity
         return total_value
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
+        initial_spend = self.ledger.net_trade_spend
         return portfolio_value - initial_spend - self.balance
 
+    def rebuild_ledger(self, mode: str | None = None) -> bool:
+        """
+        Rebuild the ledger from the transaction history, in mode if given (which switches the
+        account to that cost basis mode); return whether the stored one was consistent.
+        """
+        self._require_history()
+        rebuilt = Ledger.rebuild(self.transactions, mode or self.ledger.mode)
+        consistent = rebuilt.matches(self.ledger)
+        if not consistent:
+            self.ledger = rebuilt
+            write_ledger(self.name, self.ledger.model_dump(), self.version)
+            self.version += 1
+        return consistent
+
+    @property
+    def transaction_count(self) -> int:
+        """ How many transactions the account has made, loaded or not. """
+        if self._transaction_count is None:
+            return len(self.transactions)
+        return self._transaction_count
+
     def get_holdings(self):
         """ Report the current holdings of the user. """
         return self.holdings
 
+    def get_portfolio_value_series(self, start=None, end=None, resolution="auto"):
+        """ Return (timestamp, open, high, low, close) portfolio values for a time range and resolution. """
+        return read_portfolio_values(self.name, start, end, resolution)
+
     def get_profit_loss(self):
         """ Report the user's profit or loss at any point in time. """
-        return self.calculate_profit_loss()
+        return self.calculate_profit_loss(self.calculate_portfolio_value())
 
     def list_transactions(self):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
-    def report(self) -> str:
-        """ Return a json string representing the account.  """
-        portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
-        pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
-        data["total_portfolio_value"] = portfolio_value
-        data["total_profit_loss"] = pnl
+    def report(self, fields: list[str] | None = None, transactions_limit: int | None = None) -> str:
+        """
+        Return a json string representing the account.
+
+        fields projects it to a subset of REPORT_FIELDS, and transactions_limit keeps only the
+        latest transactions (transaction_count still gives the total), so the report can be
+        kept to a bounded size however long the account's history is.
+        """
+        fields = REPORT_FIELDS if fields is None else fields
+        unknown = set(fields) - set(REPORT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown account fields {sorted(unknown)}; expected some of {list(REPORT_FIELDS)}")
+        if transactions_limit is not None and transactions_limit < 0:
+            raise ValueError("transactions_limit must not be negative.")
+        prices = get_share_prices(self.holdings.keys())
+        portfolio_value = self.calculate_portfolio_value(prices)
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.portfolio_value_time_series.append((timestamp, portfolio_value))
+        write_portfolio_value(self.name, timestamp, portfolio_value)
+        transactions = self.transactions
+        if transactions_limit is not None:
+            transactions = transactions[-transactions_limit:] if transactions_limit else []
+        values = {
+            "name": lambda: self.name,
+            "balance": lambda: self.balance,
+            "strategy": lambda: self.strategy,
+            "holdings": lambda: self.holdings,
+            "transactions": lambda: [transaction.model_dump() for transaction in transactions],
+            "transaction_count": lambda: self.transaction_count,
+            "portfolio_value_time_series": lambda: self.portfolio_value_time_series,
+            "total_portfolio_value": lambda: portfolio_value,
+            "total_profit_loss": lambda: self.calculate_profit_loss(portfolio_value),
+            "realized_profit_loss": lambda: self.ledger.realized_pnl,
+            "unrealized_profit_loss": lambda: self.ledger.unrealized_pnl(prices),
+        }
+        data = {field: values[field]() for field in REPORT_FIELDS if field in fields}
         write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
+
+    def summary(self) -> str:
+        """ Return the compact json report: values, holdings, P&L and the latest few transactions. """
+        return self.report(SUMMARY_FIELDS, SUMMARY_TRANSACTIONS)
     
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
@@ -170,10 +416,73 @@ class Account(BaseModel):
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
         self.strategy = strategy
-        self.save()
+        write_strategy(self.name, strategy, self.version)
+        self.version += 1
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
+def update_account(name: str, operation, transactions_limit: int | None = SUMMARY_TRANSACTIONS):
+    """
+    Apply operation to a freshly read Account and return its result, retrying on a write conflict.
+
+    Account writes are compare-and-swap on the row version, so when another writer changes the
+    account between our read and our write, the write raises StaleAccountError and changes
+    nothing. The operation is then re-run, after a short jittered backoff, against a new read
+    of the account: it decides again from the current balance and holdings, so retrying cannot
+    double a trade or lose the other writer's. Operations must only change the account through
+    its own writes, which is true of every Account method. The account is read with only its
+    latest transactions_limit transactions (see Account.get), so a write costs the same however
+    long the history is; pass None for operations that need all of it. The backoff sleeps, so
+    async callers should run this in a worker thread.
+    """
+    for attempt in range(ACCOUNT_WRITE_RETRIES + 1):
+        account = Account.get(name, transactions_limit)
+        try:
+            return operation(account)
+        except StaleAccountError:
+            with _conflict_lock:
+                _conflict_stats["conflicts"] += 1
+                if attempt == ACCOUNT_WRITE_RETRIES:
+                    _conflict_stats["exhausted"] += 1
+                    raise
+                _conflict_stats["retries"] += 1
+            time.sleep(random.uniform(0, ACCOUNT_RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def transactions_page(name: str, cursor: int | None = None, limit: int = 20) -> dict:
+    """
+    One page of an account's transactions, newest first, read without loading the account.
+    Pass the returned next_cursor back as cursor for the page of older transactions; it is
+    None on the last page.
+    """
+    if not 1 <= limit <= MAX_TRANSACTIONS_PAGE:
+        raise ValueError(f"limit must be between 1 and {MAX_TRANSACTIONS_PAGE}.")
+    transactions = read_transactions_page(name, cursor, limit + 1)
+    more = len(transactions) > limit
+    transactions = transactions[:limit]
+    return {"transactions": transactions, "next_cursor": transactions[-1]["id"] if more else None}
+
+
+def rebuild_ledgers(mode: str | None = None) -> dict[str, bool]:
+    """
+    Replay every account's transactions into a fresh ledger and store it wherever the stored
+    one disagrees; return, by account, whether the stored ledger was consistent. With mode,
+    every account is switched to that cost basis mode: COST_BASIS_MODE only applies to
+    accounts created after it is set, so this is how existing accounts are migrated.
+    """
+    mode = check_mode(mode) if mode else None
+    return {
+        name: update_account(name, lambda account: account.rebuild_ledger(mode), transactions_limit=None)
+        for name in read_account_names()
+    }
+
+
+def account_conflict_stats() -> dict:
+    """How many account writes in this process hit a version conflict, were retried or gave up"""
+    with _conflict_lock:
+        return dict(_conflict_stats)
+
+
 # Example of usage:
 if __name__ == "__main__":
     account = Account("John Doe")
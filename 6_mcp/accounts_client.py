@@ -1,50 +1,207 @@
+import asyncio
+import copy
+import time
 import mcp
 from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_connected_server_and_client_session
+from mcp_inprocess import in_process_server
+from contextlib import asynccontextmanager
 from agents import FunctionTool
+from agents.strict_schema import ensure_strict_json_schema
+import anyio
 import json
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+HEALTH_CHECK_AFTER_IDLE_SECONDS = 30
+HEALTH_CHECK_TIMEOUT_SECONDS = 5
+
+CONNECTION_ERRORS = (McpError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+
+
+class MCPClient:
+    """
+    A long-lived ClientSession to one stdio MCP server, or to a FastMCP server in this process.
+
+    The server is spawned lazily on first use and then reused for every request. A session
+    that has been idle for a while is pinged before use, and a dead one is replaced. The
+    stdio_client and ClientSession contexts are held by a dedicated task, so the session can
+    be shared by any number of concurrent callers and closed from any of them.
+    Use `async with` to tie the server's lifetime to a block.
+    """
+
+    def __init__(self, params: StdioServerParameters, server: FastMCP | None = None):
+        self.params = params
+        self.server = server
+        self.connects = 0
+        self._session = None
+        self._task = None
+        self._loop = None
+        self._closing = None
+        self._lock = None
+        self._last_used = 0.0
+
+    async def __aenter__(self):
+        await self.session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @asynccontextmanager
+    async def _open_session(self):
+        if self.server is not None:
+            async with create_connected_server_and_client_session(self.server._mcp_server) as session:
+                yield session
+            return
+        async with stdio_client(self.params) as streams:
+            async with mcp.ClientSession(*streams) as session:
+                await session.initialize()
+                yield session
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with self._open_session() as session:
+                self._session = session
+                ready.set_result(session)
+                await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        except BaseException:
+            # Cancelled or interrupted: release a caller still waiting to connect, then propagate
+            if not ready.done():
+                ready.cancel()
+            raise
+        finally:
+            self._session = None
+
+    async def _connect(self):
+        self._closing = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+        self.connects += 1
+
+    async def _ping(self, session) -> bool:
+        try:
+            await asyncio.wait_for(session.send_ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+            return True
+        except (asyncio.TimeoutError, *CONNECTION_ERRORS):
+            return False
+
+    async def _is_healthy(self) -> bool:
+        if self._session is None or self._task.done():
+            return False
+        if time.monotonic() - self._last_used < HEALTH_CHECK_AFTER_IDLE_SECONDS:
+            return True
+        return await self._ping(self._session)
+
+    async def session(self) -> mcp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A session from a previous event loop (e.g. an earlier asyncio.run) can't be reused
+            self._loop, self._lock, self._session, self._task = loop, asyncio.Lock(), None, None
+        async with self._lock:
+            if not await self._is_healthy():
+                await self._disconnect()
+                await self._connect()
+            self._last_used = time.monotonic()
+            return self._session
+
+    async def request(self, call, idempotent: bool = True):
+        """
+        Run `await call(session)`. If the connection turns out to be broken, the session is
+        replaced, and the call is retried once on the new session when it is safe to repeat.
+        """
+        session = await self.session()
+        try:
+            return await call(session)
+        except CONNECTION_ERRORS:
+            if await self._ping(session):
+                raise
+            async with self._lock:
+                if self._session is session:
+                    await self._disconnect()
+            if not idempotent:
+                raise
+            return await call(await self.session())
+
+    async def _disconnect(self):
+        if self._task is not None:
+            self._closing.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def close(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            await self._disconnect()
+
+
+accounts_client = MCPClient(params, in_process_server("accounts_server.py"))
+
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    result = await accounts_client.request(lambda session: session.list_tools())
+    return result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
+    return await accounts_client.request(
+        lambda session: session.call_tool(tool_name, tool_args), idempotent=False
+    )
+
 async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    result = await accounts_client.request(
+        lambda session: session.read_resource(f"accounts://accounts_server/{name}")
+    )
+    return result.contents[0].text
+
+async def read_account_summary_resource(name):
+    result = await accounts_client.request(
+        lambda session: session.read_resource(f"accounts://summary/{name}")
+    )
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await accounts_client.request(
+        lambda session: session.read_resource(f"accounts://strategy/{name}")
+    )
+    return result.contents[0].text
+
+def strict_tool_schema(schema: dict) -> dict:
+    """
+    An MCP tool's input schema in the form OpenAI's strict mode accepts: every property
+    required, objects closed (nested $defs included), and optional arguments made nullable, with
+    null standing for "use the default".
+    """
+    schema = copy.deepcopy(schema)
+    required = set(schema.get("required", []))
+    for name, prop in schema.get("properties", {}).items():
+        if name in required:
+            continue
+        prop.pop("default", None)
+        if not any(option.get("type") == "null" for option in prop.get("anyOf", [])):
+            description = {key: prop.pop(key) for key in ("title", "description") if key in prop}
+            schema["properties"][name] = {"anyOf": [prop, {"type": "null"}], **description}
+    return ensure_strict_json_schema(schema)
+
+def _omit_nulls(args: str) -> dict:
+    """Drop the optional arguments the model left null, so the tool applies its defaults"""
+    return {key: value for key, value in json.loads(args).items() if value is not None}
 
 async def get_accounts_tools_openai():
     openai_tools = []
     for tool in await list_accounts_tools():
-        schema = {**tool.inputSchema, "additionalProperties": False}
         openai_tool = FunctionTool(
             name=tool.name,
             description=tool.description,
-            params_json_schema=schema,
-            on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+            params_json_schema=strict_tool_schema(tool.inputSchema),
+            on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, _omit_nulls(args)),
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
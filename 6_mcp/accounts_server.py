@@ -1,8 +1,14 @@
+import json
+import asyncio
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from accounts import Account, Order, SUMMARY_TRANSACTIONS, update_account, transactions_page
 
 mcp = FastMCP("accounts_server")
 
+# Every tool and resource does its database work, and any price lookups, in a worker thread,
+# so a slow read or a write that backs off after a conflict never stalls the event loop, which
+# every trader shares when the server runs in process.
+
 @mcp.tool()
 async def get_balance(name: str) -> float:
     """Get the cash balance of the given account name.
@@ -10,7 +16,7 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    return await asyncio.to_thread(lambda: Account.get(name, 0).balance)
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,7 +25,7 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    return await asyncio.to_thread(lambda: Account.get(name, 0).holdings)
 
 @mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
@@ -31,7 +37,9 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(
+        update_account, name, lambda account: account.buy_shares(symbol, quantity, rationale)
+    )
 
 
 @mcp.tool()
@@ -44,7 +52,23 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(
+        update_account, name, lambda account: account.sell_shares(symbol, quantity, rationale)
+    )
+
+@mcp.tool()
+async def execute_orders(name: str, orders: list[Order], all_or_nothing: bool = True) -> dict:
+    """Buy and sell several stocks at once, at one set of prices, in a single step.
+    Prefer this to repeated buy_shares and sell_shares calls when making more than one trade.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with a side ("buy" or "sell"), symbol, quantity and rationale; sells can fund later buys
+        all_or_nothing: If true, nothing is traded unless every order can be executed; if false, orders that can't be executed are skipped
+    """
+    return await asyncio.to_thread(
+        update_account, name, lambda account: account.execute_orders(orders, all_or_nothing)
+    )
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -54,17 +78,50 @@ async def change_strategy(name: str, strategy: str) -> str:
         name: The name of the account holder
         strategy: The new strategy for the account
     """
-    return Account.get(name).change_strategy(strategy)
+    return await asyncio.to_thread(
+        update_account, name, lambda account: account.change_strategy(strategy)
+    )
+
+@mcp.tool()
+async def get_account(name: str, fields: list[str] | None = None, transactions_limit: int | None = 10) -> str:
+    """Get the details of the given account name, optionally only some of them.
+
+    Args:
+        name: The name of the account holder
+        fields: The fields to return, from name, balance, strategy, holdings, transactions, transaction_count, portfolio_value_time_series, total_portfolio_value, total_profit_loss, realized_profit_loss and unrealized_profit_loss; all of them if omitted
+        transactions_limit: How many of the latest transactions to include; use list_transactions to page through older ones
+    """
+    # Only the time series needs the account's whole history; otherwise read just what's reported
+    full = transactions_limit is None or fields is None or "portfolio_value_time_series" in fields
+    limit = None if full else transactions_limit
+    return await asyncio.to_thread(lambda: Account.get(name, limit).report(fields, transactions_limit))
+
+@mcp.tool()
+async def list_transactions(name: str, cursor: int | None = None, limit: int = 20) -> dict:
+    """List the transactions of the given account name, newest first, one page at a time.
+
+    Args:
+        name: The name of the account holder
+        cursor: The next_cursor returned with the previous page, to get the older transactions after it; omit for the latest
+        limit: How many transactions to return, at most 100
+    """
+    return await asyncio.to_thread(transactions_page, name, cursor, limit)
 
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.report()
+    return await asyncio.to_thread(lambda: Account.get(name.lower()).report())
+
+@mcp.resource("accounts://summary/{name}")
+async def read_account_summary_resource(name: str) -> str:
+    return await asyncio.to_thread(lambda: Account.get(name.lower(), SUMMARY_TRANSACTIONS).summary())
+
+@mcp.resource("accounts://transactions/{name}")
+async def read_transactions_resource(name: str) -> str:
+    return json.dumps(await asyncio.to_thread(transactions_page, name.lower()))
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.get_strategy()
+    return await asyncio.to_thread(lambda: Account.get(name.lower(), 0).get_strategy())
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
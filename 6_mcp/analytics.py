@@ -0,0 +1,211 @@
+import os
+import numpy as np
+import pandas as pd
+import clock
+from database import TIMESTAMP_FORMAT, read_portfolio_closes, read_transactions_since
+
+ANALYTICS_RESOLUTION = os.getenv("ANALYTICS_RESOLUTION", "day")
+SECONDS_PER_YEAR = 365.25 * 24 * 60 * 60
+BUCKET_FORMATS = {"hour": TIMESTAMP_FORMAT, "day": "%Y-%m-%d"}
+
+ADDITIVE = ["periods", "sum_r", "sum_r2", "sum_down2", "wins", "n_values", "sum_values"]
+STATE_COLUMNS = ["first_time", "first_value", "last_time", "last_value", *ADDITIVE, "peak", "max_drawdown"]
+
+LEADERBOARD_COLUMNS = {
+    "value": "Value",
+    "total_return": "Return",
+    "volatility": "Volatility",
+    "sharpe": "Sharpe",
+    "sortino": "Sortino",
+    "max_drawdown": "Max Drawdown",
+    "turnover": "Turnover",
+    "win_rate": "Win Rate",
+}
+
+
+def _current_bucket(resolution: str) -> str:
+    now = clock.now().strftime(TIMESTAMP_FORMAT)
+    return now[:10] if resolution == "day" else now[:13] + ":00:00"
+
+
+class PortfolioAnalytics:
+    """
+    Performance metrics for every account at once, from the hourly or daily portfolio rollups
+    and the transaction log.
+
+    Closed buckets are folded into running sums per account (returns, squared and downside
+    returns, wins, peak and worst drawdown), so a refresh reads and processes only the rows
+    written since the last one; the still-open current bucket is kept aside and added when the
+    metrics are computed. Transactions are consumed by id the same way. Every step is a pandas
+    group-by over all accounts, never a loop over rows or traders. Returns are simple period
+    returns with a zero risk-free rate, annualized by each account's own sampling frequency.
+
+    Rows deleted from the database (an account reset, or rollups aging out) are not un-folded;
+    call clear() and refresh() to start over.
+    """
+
+    def __init__(self, resolution: str = ANALYTICS_RESOLUTION):
+        if resolution not in BUCKET_FORMATS:
+            raise ValueError(f"Unknown analytics resolution {resolution}; expected hour or day")
+        self.resolution = resolution
+        self.clear()
+
+    def clear(self) -> None:
+        self.cursor = ""
+        self.last_transaction_id = 0
+        self.state = pd.DataFrame(columns=STATE_COLUMNS, dtype=float)
+        self.provisional = pd.DataFrame(columns=["time", "value"], dtype=float)
+        self.traded_value = pd.Series(dtype=float)
+        self.positions = pd.Series(dtype=float, index=pd.MultiIndex.from_tuples([], names=["name", "symbol"]))
+        self.last_prices = pd.Series(dtype=float)
+        self.metrics = pd.DataFrame()
+        self.computations = 0
+
+    def _times(self, buckets: pd.Series) -> np.ndarray:
+        times = pd.to_datetime(buckets, format=BUCKET_FORMATS[self.resolution])
+        return times.to_numpy(dtype="datetime64[s]").astype(np.int64).astype(float)
+
+    def _fold_closes(self, closes: pd.DataFrame) -> None:
+        names = closes["name"]
+        values = closes["value"].to_numpy()
+        previous = closes.groupby("name", sort=False)["value"].shift()
+        previous = previous.fillna(names.map(self.state["last_value"]))
+        returns = values / previous.to_numpy() - 1
+        peak = np.fmax(
+            closes.groupby("name", sort=False)["value"].cummax().to_numpy(),
+            names.map(self.state["peak"]).to_numpy(),
+        )
+        frame = pd.DataFrame({
+            "name": names,
+            "time": closes["time"],
+            "value": values,
+            "r": returns,
+            "r2": returns ** 2,
+            "down2": np.minimum(returns, 0) ** 2,
+            "win": returns > 0,
+            "peak": peak,
+            "drawdown": 1 - values / peak,
+        })
+        update = frame.groupby("name").agg(
+            first_time=("time", "first"),
+            first_value=("value", "first"),
+            last_time=("time", "last"),
+            last_value=("value", "last"),
+            periods=("r", "count"),
+            sum_r=("r", "sum"),
+            sum_r2=("r2", "sum"),
+            sum_down2=("down2", "sum"),
+            wins=("win", "sum"),
+            n_values=("value", "count"),
+            sum_values=("value", "sum"),
+            peak=("peak", "max"),
+            max_drawdown=("drawdown", "max"),
+        ).astype(float)
+        state = self.state.reindex(self.state.index.union(update.index))
+        update = update.reindex(state.index)
+        state[ADDITIVE] = state[ADDITIVE].fillna(0) + update[ADDITIVE].fillna(0)
+        for column in ("first_time", "first_value"):
+            state[column] = state[column].fillna(update[column])
+        for column in ("last_time", "last_value"):
+            state[column] = update[column].fillna(state[column])
+        for column in ("peak", "max_drawdown"):
+            state[column] = np.fmax(state[column], update[column])
+        self.state = state
+
+    def _fold_transactions(self, transactions: pd.DataFrame) -> None:
+        self.last_transaction_id = int(transactions["id"].iloc[-1])
+        traded = (transactions["quantity"].abs() * transactions["price"]).groupby(transactions["name"]).sum()
+        self.traded_value = self.traded_value.add(traded, fill_value=0)
+        positions = transactions.groupby(["name", "symbol"])["quantity"].sum()
+        self.positions = self.positions.add(positions, fill_value=0)
+        self.positions = self.positions[self.positions != 0]
+        prices = transactions.groupby("symbol")["price"].last()
+        self.last_prices = prices.combine_first(self.last_prices)
+
+    def refresh(self) -> bool:
+        """Fold in rows written since the last refresh; return whether the metrics changed"""
+        current = _current_bucket(self.resolution)
+        rows = read_portfolio_closes(self.cursor, self.resolution)
+        closes = pd.DataFrame(rows, columns=["name", "bucket", "value"])
+        closes["time"] = self._times(closes["bucket"])
+        closed = closes[closes["bucket"] < current]
+        provisional = closes[closes["bucket"] >= current].groupby("name")[["time", "value"]].last()
+        transactions = read_transactions_since(self.last_transaction_id)
+        changed = (
+            not closed.empty or bool(transactions) or not provisional.equals(self.provisional)
+        )
+        if not closed.empty:
+            self._fold_closes(closed)
+        if transactions:
+            self._fold_transactions(
+                pd.DataFrame(transactions, columns=["id", "name", "symbol", "quantity", "price"])
+            )
+        self.provisional = provisional
+        self.cursor = current
+        if changed or self.computations == 0:
+            self.metrics = self._compute()
+            self.computations += 1
+        return changed
+
+    def _compute(self) -> pd.DataFrame:
+        state = self.state.reindex(self.state.index.union(self.provisional.index))
+        tail = self.provisional.reindex(state.index)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = tail["value"] / state["last_value"] - 1
+            has_tail = r.notna()
+            periods = state["periods"].fillna(0) + has_tail
+            sum_r = state["sum_r"].fillna(0) + r.fillna(0)
+            sum_r2 = state["sum_r2"].fillna(0) + (r ** 2).fillna(0)
+            sum_down2 = state["sum_down2"].fillna(0) + (np.minimum(r, 0) ** 2).fillna(0)
+            wins = state["wins"].fillna(0) + (r > 0)
+            value = tail["value"].fillna(state["last_value"])
+            first_value = state["first_value"].fillna(tail["value"])
+            first_time = state["first_time"].fillna(tail["time"])
+            last_time = tail["time"].fillna(state["last_time"])
+            n_values = state["n_values"].fillna(0) + tail["value"].notna()
+            sum_values = state["sum_values"].fillna(0) + tail["value"].fillna(0)
+            peak = np.fmax(state["peak"], tail["value"])
+            max_drawdown = np.fmax(state["max_drawdown"], 1 - tail["value"] / peak)
+
+            mean = sum_r / periods
+            std = np.sqrt((sum_r2 / periods - mean ** 2).clip(lower=0))
+            downside = np.sqrt(sum_down2 / periods)
+            periods_per_year = periods / ((last_time - first_time) / SECONDS_PER_YEAR)
+            annualize = np.sqrt(periods_per_year)
+            metrics = pd.DataFrame({
+                "value": value,
+                "total_return": value / first_value - 1,
+                "volatility": std * annualize,
+                "sharpe": mean / std * annualize,
+                "sortino": mean / downside * annualize,
+                "max_drawdown": max_drawdown.fillna(0),
+                "turnover": self.traded_value.reindex(state.index).fillna(0) / (sum_values / n_values),
+                "win_rate": wins / periods,
+                "periods": periods,
+            })
+        return metrics.replace([np.inf, -np.inf], np.nan)
+
+    def exposures(self) -> pd.DataFrame:
+        """Each open position's market value and share of its account, marked at the last traded price"""
+        if self.positions.empty:
+            return pd.DataFrame(columns=["name", "symbol", "quantity", "market_value", "weight"])
+        frame = self.positions.rename("quantity").reset_index()
+        frame["market_value"] = frame["quantity"] * frame["symbol"].map(self.last_prices)
+        frame["weight"] = frame["market_value"] / frame["name"].map(self.metrics.get("value"))
+        return frame
+
+    def leaderboard(self, names: list[str] | None = None) -> pd.DataFrame:
+        """Accounts ranked by total return, with their largest position, for display"""
+        metrics = self.metrics
+        if names is not None:
+            metrics = metrics.reindex([name.lower() for name in names]).dropna(subset=["value"])
+        board = metrics[list(LEADERBOARD_COLUMNS)].rename(columns=LEADERBOARD_COLUMNS)
+        board["Largest Position"] = ""
+        exposures = self.exposures().dropna(subset=["weight"])
+        if not exposures.empty:
+            largest = exposures.loc[exposures.groupby("name")["weight"].idxmax()].set_index("name")
+            label = largest["symbol"] + " " + (largest["weight"] * 100).map("{:.0f}%".format)
+            board["Largest Position"] = label.reindex(board.index).fillna("")
+        board = board.sort_values("Return", ascending=False).round(3)
+        board.index = board.index.str.title()
+        return board.rename_axis("Trader").reset_index()
@@ -1,10 +1,15 @@
 import gradio as gr
+import asyncio
+import threading
+import time
 from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
-from accounts import Account
-from database import read_log
+from accounts import Account, transactions_page
+from analytics import PortfolioAnalytics
+from span_metrics import time_breakdown
+from database import read_log_since
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,6 +20,11 @@ mapper = {
     "account": Color.RED,
 }
 
+LOG_LINES = 13
+TRANSACTION_ROWS = 100
+REFRESH_SECONDS = 120
+PUSH_CHECK_SECONDS = 1
+
 
 class Trader:
     def __init__(self, name: str, lastname: str, model_name: str):
@@ -33,7 +43,10 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+        series = self.account.get_portfolio_value_series()
+        df = pd.DataFrame(
+            [(timestamp, close) for timestamp, _, _, _, close in series], columns=["datetime", "value"]
+        )
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
@@ -65,12 +78,12 @@ class Trader:
         return df
 
     def get_transactions_df(self) -> pd.DataFrame:
-        """Convert transactions to DataFrame for display"""
-        transactions = self.account.list_transactions()
+        """Convert the latest transactions, newest first, to a DataFrame for display"""
+        transactions = transactions_page(self.name, limit=TRANSACTION_ROWS)["transactions"]
         if not transactions:
             return pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"])
 
-        return pd.DataFrame(transactions)
+        return pd.DataFrame(transactions).drop(columns="id")
 
     def get_portfolio_value(self) -> str:
         """Calculate total portfolio value based on current prices"""
@@ -80,41 +93,127 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
+    def render_logs(self, logs) -> str:
         response = ""
         for log in logs:
-            timestamp, type, message = log
+            _, timestamp, type, message = log
             color = mapper.get(type, Color.WHITE).value
             response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+        return f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
+
+    def get_logs(self) -> str:
+        return self.render_logs(read_log_since(self.name, last_n=LOG_LINES))
+
+    def get_new_logs(self, cursor=None):
+        """Fetch only the entries after this session's cursor; an idle log costs one index probe"""
+        last_id, logs = cursor or (0, [])
+        new_logs = read_log_since(self.name, last_id, last_n=LOG_LINES)
+        if cursor is not None and not new_logs:
+            return gr.update(), cursor
+        if new_logs:
+            last_id = new_logs[-1][0]
+        logs = (logs + new_logs)[-LOG_LINES:]
+        return self.render_logs(logs), (last_id, logs)
+
+
+class DashboardCache:
+    """
+    The view model of every trader, computed once per interval for the whole process.
+
+    A background thread reloads each account, values it and builds its chart and tables every
+    REFRESH_SECONDS. Browser sessions only read the shared result, so the database and price
+    lookups cost the same however many viewers are connected.
+    """
+
+    def __init__(self, traders: list[Trader], interval: float = REFRESH_SECONDS):
+        self.traders = traders
+        self.interval = interval
+        self.version = 0
+        # Placeholders until a trader's first successful refresh, so the UI can always be built
+        self.views = {trader.name: self.empty_view() for trader in traders}
+        self.analytics = PortfolioAnalytics()
+        self.leaderboard = pd.DataFrame()
+        self.time_breakdown = pd.DataFrame()
+        self._thread = None
+
+    def refresh(self):
+        for trader in self.traders:
+            try:
+                trader.reload()
+                self.views[trader.name] = (
+                    trader.get_portfolio_value(),
+                    trader.get_portfolio_value_chart(),
+                    trader.get_holdings_df(),
+                    trader.get_transactions_df(),
+                )
+            except Exception as e:
+                print(f"Failed to refresh the dashboard for {trader.name}: {e}")
+        try:
+            self.analytics.refresh()
+            self.leaderboard = self.analytics.leaderboard([trader.name for trader in self.traders])
+        except Exception as e:
+            print(f"Failed to refresh the leaderboard: {e}")
+        try:
+            self.time_breakdown = time_breakdown([trader.name for trader in self.traders])
+        except Exception as e:
+            print(f"Failed to refresh the span timings: {e}")
+        self.version += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def start(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="dashboard-refresh", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def empty_view():
+        chart = px.line(pd.DataFrame({"datetime": [], "value": []}), x="datetime", y="value")
+        chart.update_layout(height=300, paper_bgcolor="#bbb", plot_bgcolor="#dde")
+        return (
+            "<div style='text-align: center;font-size:24px;'>Loading...</div>",
+            chart,
+            pd.DataFrame(columns=["Symbol", "Quantity"]),
+            pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"]),
+        )
+
+    def get(self, name: str):
+        return self.views.get(name) or self.empty_view()
+
+    async def push_floor_tables(self):
+        version = None
+        while True:
+            if self.version != version:
+                version = self.version
+                yield self.leaderboard, self.time_breakdown
+            await asyncio.sleep(PUSH_CHECK_SECONDS)
 
 
 class TraderView:
-    def __init__(self, trader: Trader):
+    def __init__(self, trader: Trader, cache: DashboardCache):
         self.trader = trader
+        self.cache = cache
         self.portfolio_value = None
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
 
     def make_ui(self):
+        portfolio_value, chart, holdings, transactions = self.cache.get(self.trader.name)
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML(portfolio_value)
             with gr.Row():
-                self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
-                )
+                self.chart = gr.Plot(chart, container=True, show_label=False)
             with gr.Row(variant="panel"):
                 self.log = gr.HTML(self.trader.get_logs)
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
+                    value=holdings,
                     label="Holdings",
                     headers=["Symbol", "Quantity"],
                     row_count=(5, "dynamic"),
@@ -124,7 +223,7 @@ class TraderView:
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
+                    value=transactions,
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -133,36 +232,30 @@ class TraderView:
                     elem_classes=["dataframe-fix"],
                 )
 
-        timer = gr.Timer(value=120)
-        timer.tick(
-            fn=self.refresh,
-            inputs=[],
-            outputs=[
-                self.portfolio_value,
-                self.chart,
-                self.holdings_table,
-                self.transactions_table,
-            ],
-            show_progress="hidden",
-            queue=False,
-        )
+        log_cursor = gr.State(None)
         log_timer = gr.Timer(value=0.5)
         log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
+            fn=self.trader.get_new_logs,
+            inputs=[log_cursor],
+            outputs=[self.log, log_cursor],
             show_progress="hidden",
             queue=False,
         )
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+    def outputs(self):
+        return [self.portfolio_value, self.chart, self.holdings_table, self.transactions_table]
+
+    async def push_updates(self):
+        """
+        Stream this trader's view to one browser session, sending it only when the shared cache
+        has been refreshed; checking for a change is an in-memory comparison, not a reload.
+        """
+        version = None
+        while True:
+            if self.cache.version != version:
+                version = self.cache.version
+                yield self.cache.get(self.trader.name)
+            await asyncio.sleep(PUSH_CHECK_SECONDS)
 
 
 # Main UI construction
@@ -173,14 +266,43 @@ def create_ui():
         Trader(trader_name, lastname, model_name)
         for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
     ]
-    trader_views = [TraderView(trader) for trader in traders]
+    cache = DashboardCache(traders)
+    cache.start()
+    trader_views = [TraderView(trader, cache) for trader in traders]
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
+        with gr.Row():
+            leaderboard = gr.Dataframe(
+                value=cache.leaderboard,
+                label="Leaderboard",
+                max_height=250,
+                elem_classes=["dataframe-fix-small"],
+            )
         with gr.Row():
             for trader_view in trader_views:
                 trader_view.make_ui()
+        with gr.Row():
+            where_time_went = gr.Dataframe(
+                value=cache.time_breakdown,
+                label="Where did the time go",
+                max_height=300,
+                elem_classes=["dataframe-fix-small"],
+            )
+        ui.load(
+            cache.push_floor_tables,
+            outputs=[leaderboard, where_time_went],
+            show_progress="hidden",
+            concurrency_limit=None,
+        )
+        for trader_view in trader_views:
+            ui.load(
+                trader_view.push_updates,
+                outputs=trader_view.outputs(),
+                show_progress="hidden",
+                concurrency_limit=None,
+            )
 
     return ui
 
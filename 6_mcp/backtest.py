@@ -0,0 +1,343 @@
+"""
+Deterministic offline backtests of the trading floor.
+
+    uv run backtest.py prices.csv --start 2024-01-02 --end 2024-12-31 --traders 20
+
+The floor runs on a simulated clock that steps through the market sessions of a trading
+calendar every RUN_EVERY_N_MINUTES. Prices are replayed from a local historical store: a CSV
+or Parquet file in long format (a time or date column, a symbol or ticker column, and a close
+or price column) or the `market` table of an accounts database. Traders are real agents with
+the accounts and market MCP servers mounted in process, driven by a scripted model instead of
+an LLM, so a run needs no network, no API keys and gives the same report every time. With
+--model they use traders.get_model instead, which replays recorded model responses when
+MODEL_CACHE_MODE=replay (see model_cache.py).
+
+Accounts live in BACKTEST_DB, which is recreated on every run and kept afterwards so the
+dashboard can be pointed at it (ACCOUNTS_DB=backtest.db uv run app.py); without it a scratch
+database is used. The report is printed as JSON, one entry per trader.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import atexit
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from datetime import date, datetime, time as clock_time, timedelta
+
+BACKTEST_DB = os.getenv("BACKTEST_DB")
+if BACKTEST_DB:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(BACKTEST_DB + suffix):
+            os.remove(BACKTEST_DB + suffix)
+else:
+    SCRATCH_DIR = tempfile.mkdtemp(prefix="trading_floor_backtest_")
+    atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+    BACKTEST_DB = os.path.join(SCRATCH_DIR, "accounts.db")
+os.environ["ACCOUNTS_DB"] = BACKTEST_DB
+
+import sqlite3  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from agents import Agent, Runner, set_tracing_disabled  # noqa: E402
+from openai.types.responses import ResponseFunctionToolCall  # noqa: E402
+import clock  # noqa: E402
+import market  # noqa: E402  (must be imported after ACCOUNTS_DB is pointed at the backtest DB)
+import accounts_server  # noqa: E402
+import market_server  # noqa: E402
+from accounts import Account, SPREAD, SUMMARY_TRANSACTIONS  # noqa: E402
+from analytics import PortfolioAnalytics  # noqa: E402
+from mcp_inprocess import MCPServerInProcess  # noqa: E402
+from scripted_model import ScriptedModel, message, tool_call, tool_history  # noqa: E402
+from templates import trader_instructions, trade_message, rebalance_message  # noqa: E402
+from traders import get_model  # noqa: E402
+
+RUN_EVERY_N_MINUTES = int(os.getenv("RUN_EVERY_N_MINUTES", "60"))
+MARKET_OPEN = clock_time(9, 30)
+MARKET_CLOSE = clock_time(16, 0)
+MAX_TURNS = 30
+DEFAULT_UNIVERSE_SIZE = 20
+
+TIME_COLUMNS = ("timestamp", "datetime", "date", "time")
+SYMBOL_COLUMNS = ("symbol", "ticker")
+PRICE_COLUMNS = ("close", "price")
+
+
+def _column(frame: pd.DataFrame, candidates: tuple[str, ...]) -> str:
+    for column in frame.columns:
+        if column.lower() in candidates:
+            return column
+    raise ValueError(f"Price data needs one of the columns {candidates}; found {list(frame.columns)}")
+
+
+class HistoricalPrices:
+    """
+    Closing prices over time as a forward-filled (time x symbol) matrix, so pricing a basket at
+    any moment is one binary search over the timestamps and a row lookup per symbol.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        """frame has time, symbol and price columns; a price is known from its time onwards"""
+        wide = frame.pivot_table(index="time", columns="symbol", values="price", aggfunc="last")
+        wide = wide.sort_index().ffill()
+        self.times = wide.index.to_numpy(dtype="datetime64[s]")
+        self.values = wide.to_numpy()
+        self.symbols = list(wide.columns)
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.trading_days = set(wide.index.date)
+        self.points = frame.groupby("symbol").size()
+
+    @classmethod
+    def from_file(cls, path: str) -> "HistoricalPrices":
+        if path.endswith(".db"):
+            return cls.from_market_table(path)
+        frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        times = pd.to_datetime(frame[_column(frame, TIME_COLUMNS)])
+        if (times == times.dt.normalize()).all():
+            # Daily bars: a close is only known once the session is over
+            times = times + timedelta(hours=MARKET_CLOSE.hour, minutes=MARKET_CLOSE.minute)
+        return cls(pd.DataFrame({
+            "time": times,
+            "symbol": frame[_column(frame, SYMBOL_COLUMNS)].astype(str),
+            "price": frame[_column(frame, PRICE_COLUMNS)].astype(float),
+        }))
+
+    @classmethod
+    def from_market_table(cls, path: str) -> "HistoricalPrices":
+        """The prior closes the floor cached per day in an accounts database's market table"""
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            rows = conn.execute("SELECT date, data FROM market ORDER BY date").fetchall()
+        records = [(day, symbol, price) for day, data in rows for symbol, price in json.loads(data).items()]
+        frame = pd.DataFrame(records, columns=["time", "symbol", "price"])
+        frame["time"] = pd.to_datetime(frame["time"])
+        return cls(frame)
+
+    def prices_at(self, when: datetime, symbols: list[str]) -> dict[str, float]:
+        row = np.searchsorted(self.times, np.datetime64(when, "s"), side="right") - 1
+        prices = {}
+        for symbol in symbols:
+            column = self.columns.get(symbol)
+            price = self.values[row, column] if row >= 0 and column is not None else np.nan
+            prices[symbol] = 0.0 if np.isnan(price) else float(price)
+        return prices
+
+    def most_traded(self, n: int) -> list[str]:
+        """The n symbols with the most price points, as a deterministic default universe"""
+        ranked = sorted(self.points.items(), key=lambda item: (-item[1], item[0]))
+        return [symbol for symbol, _ in ranked[:n]]
+
+
+class MarketCalendar:
+    """Weekday sessions on the days the historical store has prices for"""
+
+    def __init__(self, trading_days: set[date], open: clock_time = MARKET_OPEN, close: clock_time = MARKET_CLOSE):
+        self.trading_days = {day for day in trading_days if day.weekday() < 5}
+        self.open = open
+        self.close = close
+
+    def is_open(self, when: datetime) -> bool:
+        return when.date() in self.trading_days and self.open <= when.time() < self.close
+
+    def ticks(self, start: date, end: date, interval: timedelta):
+        """Every interval through each session between start and end, inclusive"""
+        for day in sorted(self.trading_days):
+            if start <= day <= end:
+                when = datetime.combine(day, self.open)
+                while when.time() < self.close and when.date() == day:
+                    yield when
+                    when += interval
+
+
+class MarketReplay:
+    """What market.set_replay needs: prices and market hours as of the simulated clock"""
+
+    def __init__(self, prices: HistoricalPrices, calendar: MarketCalendar):
+        self.historical_prices = prices
+        self.calendar = calendar
+
+    def prices(self, symbols: list[str]) -> dict[str, float]:
+        return self.historical_prices.prices_at(clock.now(), symbols)
+
+    def is_open(self) -> bool:
+        return self.calendar.is_open(clock.now())
+
+
+class SeededPolicyModel(ScriptedModel):
+    """
+    A stand-in for an LLM that trades by a fixed, seeded policy through the real MCP tools.
+
+    The first turn asks for the balance, holdings and prices of its universe; the second buys
+    or sells based on the answers; the last signs off. Decisions are drawn from a random
+    generator seeded by the seed, the account and the simulated time, so runs are repeatable.
+    """
+
+    def __init__(self, account_name: str, universe: list[str], seed: int = 0):
+        self.account_name = account_name
+        self.universe = universe
+        self.seed = seed
+
+    def _call(self, step: int, index: int, tool: str, **arguments) -> ResponseFunctionToolCall:
+        return tool_call(f"call_{step}_{index}", tool, **arguments)
+
+    def _decide(self, results: dict) -> list[ResponseFunctionToolCall]:
+        rng = random.Random(f"{self.seed}:{self.account_name}:{clock.now().isoformat()}")
+        balance = float(results.get("get_balance") or 0.0)
+        holdings = results.get("get_holdings") or {}
+        prices = results.get("lookup_share_prices") or {}
+        rationale = "Scripted backtest trade"
+        draw = rng.random()
+        if holdings and draw < 0.3:
+            symbol = rng.choice(sorted(holdings))
+            quantity = max(1, holdings[symbol] // 2)
+            return [self._call(2, 0, "sell_shares", name=self.account_name, symbol=symbol, quantity=quantity, rationale=rationale)]
+        priced = [symbol for symbol in self.universe if prices.get(symbol)]
+        if priced and draw < 0.8:
+            symbol = rng.choice(priced)
+            quantity = int(balance * 0.1 / (prices[symbol] * (1 + SPREAD)))
+            if quantity >= 1:
+                return [self._call(2, 0, "buy_shares", name=self.account_name, symbol=symbol, quantity=quantity, rationale=rationale)]
+        return []
+
+    def respond(self, input) -> list:
+        names, results = tool_history(input)
+        if not names:
+            return [
+                self._call(1, 0, "get_balance", name=self.account_name),
+                self._call(1, 1, "get_holdings", name=self.account_name),
+                self._call(1, 2, "lookup_share_prices", symbols=self.universe),
+            ]
+        if not {"buy_shares", "sell_shares"} & set(names.values()) and (trades := self._decide(results)):
+            return trades
+        return [message("Trading complete for this cycle; the portfolio follows its scripted policy.")]
+
+
+class Backtest:
+    """Run a set of traders through a calendar on the simulated clock and report per trader"""
+
+    def __init__(
+        self,
+        prices: HistoricalPrices,
+        trader_names: list[str],
+        start: date,
+        end: date,
+        universe: list[str] | None = None,
+        interval_minutes: int = RUN_EVERY_N_MINUTES,
+        seed: int = 0,
+        model_factory=None,
+    ):
+        self.prices = prices
+        self.calendar = MarketCalendar(prices.trading_days)
+        self.trader_names = trader_names
+        self.start = start
+        self.end = end
+        self.universe = universe or prices.most_traded(DEFAULT_UNIVERSE_SIZE)
+        self.interval = timedelta(minutes=interval_minutes)
+        self.seed = seed
+        self.model_factory = model_factory or (lambda name: SeededPolicyModel(name, self.universe, seed))
+        self.now = datetime.combine(start, MARKET_OPEN)
+        self.cycles = 0
+        self.errors = 0
+
+    def _agent(self, name: str, servers) -> Agent:
+        return Agent(
+            name=name,
+            instructions=trader_instructions(name),
+            model=self.model_factory(name),
+            mcp_servers=servers,
+        )
+
+    async def _run_trader(self, agent: Agent, do_trade: bool) -> None:
+        account = Account.get(agent.name, SUMMARY_TRANSACTIONS)
+        report = account.summary()
+        message = trade_message if do_trade else rebalance_message
+        try:
+            await Runner.run(agent, message(agent.name, account.get_strategy(), report), max_turns=MAX_TURNS)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error running trader {agent.name} at {self.now}: {e}", file=sys.stderr)
+
+    async def run(self) -> dict:
+        set_tracing_disabled(True)
+        clock.set_clock(lambda: self.now)
+        market.set_replay(MarketReplay(self.prices, self.calendar))
+        servers = [MCPServerInProcess(accounts_server.mcp), MCPServerInProcess(market_server.mcp)]
+        agents = [self._agent(name, servers) for name in self.trader_names]
+        started = time.perf_counter()
+        try:
+            for name in self.trader_names:
+                Account.get(name, 0).reset("")
+            for self.now in self.calendar.ticks(self.start, self.end, self.interval):
+                do_trade = self.cycles % 2 == 0
+                await asyncio.gather(*[self._run_trader(agent, do_trade) for agent in agents])
+                self.cycles += 1
+            return self.report(time.perf_counter() - started)
+        finally:
+            market.set_replay(None)
+            clock.set_clock(None)
+
+    def report(self, elapsed_seconds: float) -> dict:
+        analytics = PortfolioAnalytics("day")
+        analytics.refresh()
+        metrics = analytics.metrics.round(6)
+        traders = {}
+        for name in self.trader_names:
+            account = Account.get(name, 0)
+            row = metrics.loc[name.lower()] if name.lower() in metrics.index else None
+            traders[name] = {
+                "final_value": round(account.calculate_portfolio_value(), 2),
+                "cash": round(account.balance, 2),
+                "holdings": dict(sorted(account.holdings.items())),
+                "trades": account.transaction_count,
+                "realized_profit_loss": round(account.ledger.realized_pnl, 2),
+                "metrics": {} if row is None else {k: (None if pd.isna(v) else float(v)) for k, v in row.items()},
+            }
+        fingerprint = hashlib.sha256(json.dumps(traders, sort_keys=True).encode()).hexdigest()[:16]
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "interval_minutes": int(self.interval.total_seconds() // 60),
+            "seed": self.seed,
+            "universe": self.universe,
+            "cycles": self.cycles,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed_seconds, 1),
+            "fingerprint": fingerprint,
+            "traders": traders,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deterministic offline backtest of the trading floor")
+    parser.add_argument("prices", help="CSV or Parquet price history, or an accounts .db with a market table")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day to trade (default: first day of data)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day to trade (default: last day of data)")
+    parser.add_argument("--traders", type=int, default=4, help="Number of traders")
+    parser.add_argument("--symbols", nargs="*", help="Universe the scripted traders pick from")
+    parser.add_argument("--interval", type=int, default=RUN_EVERY_N_MINUTES, help="Minutes between cycles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", help="Model for traders.get_model, instead of the scripted model")
+    args = parser.parse_args(argv)
+
+    prices = HistoricalPrices.from_file(args.prices)
+    days = sorted(prices.trading_days)
+    backtest = Backtest(
+        prices,
+        [f"Trader{i + 1}" for i in range(args.traders)],
+        start=args.start or days[0],
+        end=args.end or days[-1],
+        universe=args.symbols,
+        interval_minutes=args.interval,
+        seed=args.seed,
+        model_factory=(lambda name: get_model(args.model)) if args.model else None,
+    )
+    json.dump(asyncio.run(backtest.run()), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
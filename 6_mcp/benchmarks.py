@@ -0,0 +1,555 @@
+"""
+Micro-benchmarks for the trading floor's hot paths.
+
+Run from this directory with `uv run benchmarks.py <benchmark>` (or `all`). Every benchmark
+works against a scratch database in a temporary directory, so accounts.db is never touched,
+and prints its results as a JSON object so runs can be compared between versions.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import itertools
+import tempfile
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="trading_floor_bench_")
+os.environ["ACCOUNTS_DB"] = os.path.join(SCRATCH_DIR, "accounts.db")
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+
+import database  # noqa: E402  (must be imported after ACCOUNTS_DB is pointed at the scratch dir)
+
+
+def ops_per_second(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return n / (time.perf_counter() - start)
+
+
+# The connect-per-call data layer that database.py used to implement, kept for comparison
+
+
+def legacy_write_account(name, account_dict):
+    with sqlite3.connect(database.DB) as conn:
+        conn.execute(
+            "INSERT INTO accounts (name, account) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+            (name.lower(), json.dumps(account_dict)),
+        )
+        conn.commit()
+
+
+def legacy_read_account(name):
+    with sqlite3.connect(database.DB) as conn:
+        row = conn.execute("SELECT account FROM accounts WHERE name = ?", (name.lower(),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def legacy_write_log(name, type, message):
+    with sqlite3.connect(database.DB) as conn:
+        conn.execute(
+            "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+            (name.lower(), type, message),
+        )
+        conn.commit()
+
+
+def legacy_read_log(name, last_n=10):
+    with sqlite3.connect(database.DB) as conn:
+        rows = conn.execute(
+            "SELECT datetime, type, message FROM logs WHERE name = ? ORDER BY datetime DESC LIMIT ?",
+            (name.lower(), last_n),
+        ).fetchall()
+        return reversed(rows)
+
+
+def bench_database(n: int = 2000) -> dict:
+    """
+    Compare ops/sec of the pooled WAL connection layer against connect-per-call. The legacy
+    layer's JSON blob account is kept under its own name, as the normalized writes clear it.
+    """
+    account = {
+        "name": "bench",
+        "balance": 10_000.0,
+        "strategy": "",
+        "holdings": {"AAPL": 5},
+        "transactions": [
+            {"symbol": "AAPL", "quantity": 5, "price": 100.0, "timestamp": "2025-01-02 10:00:00", "rationale": "bench"}
+        ],
+        "portfolio_value_time_series": [("2025-01-02 10:00:00", 10_000.0)],
+    }
+    workloads = {
+        "write_account": (
+            lambda i: legacy_write_account("legacy", account),
+            lambda i: database.write_account("bench", account),
+        ),
+        "read_account": (
+            lambda i: legacy_read_account("legacy"),
+            lambda i: database.read_account("bench"),
+        ),
+        "write_log": (
+            lambda i: legacy_write_log("bench", "account", f"message {i}"),
+            lambda i: database.write_log("bench", "account", f"message {i}"),
+        ),
+        "read_log": (
+            lambda i: list(legacy_read_log("bench", 13)),
+            lambda i: list(database.read_log("bench", 13)),
+        ),
+    }
+    results = {"synchronous": database.DB_SYNCHRONOUS, "n": n}
+    for name, (legacy, pooled) in workloads.items():
+        before = ops_per_second(legacy, n)
+        after = ops_per_second(pooled, n)
+        results[name] = {
+            "connect_per_call_ops": round(before),
+            "pooled_ops": round(after),
+            "speedup": round(after / before, 2),
+        }
+    return results
+
+
+def server_params(script: str):
+    """Run one of this directory's MCP servers with the current interpreter against the scratch DB"""
+    from mcp import StdioServerParameters
+
+    return StdioServerParameters(
+        command=sys.executable,
+        args=[script],
+        env={"ACCOUNTS_DB": database.DB},
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+async def legacy_read_strategy_resource(params, name):
+    """The spawn-initialize-request-teardown cycle accounts_client.py used to run per call"""
+    import mcp
+    from mcp.client.stdio import stdio_client
+
+    async with stdio_client(params) as streams:
+        async with mcp.ClientSession(*streams) as session:
+            await session.initialize()
+            result = await session.read_resource(f"accounts://strategy/{name}")
+            return result.contents[0].text
+
+
+async def _bench_accounts_client(n: int) -> dict:
+    from accounts_client import MCPClient
+
+    params = server_params("accounts_server.py")
+    start = time.perf_counter()
+    for _ in range(n):
+        await legacy_read_strategy_resource(params, "bench")
+    before = n / (time.perf_counter() - start)
+
+    async with MCPClient(params) as client:
+        start = time.perf_counter()
+        for _ in range(n):
+            await client.request(lambda session: session.read_resource("accounts://strategy/bench"))
+        after = n / (time.perf_counter() - start)
+    return {
+        "n": n,
+        "spawn_per_call_calls_per_second": round(before, 1),
+        "pooled_session_calls_per_second": round(after, 1),
+        "speedup": round(after / before, 1),
+    }
+
+
+def bench_accounts_client(n: int = 20) -> dict:
+    """Calls/sec through accounts_client: a new server per call vs one long-lived session."""
+    return asyncio.run(_bench_accounts_client(n))
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def _simulated_cycle(open_servers, traders: int, calls: int) -> list[float]:
+    """Each trader mounts the accounts, market and push servers, lists tools, and trades"""
+    latencies = []
+
+    async def run_trader(i: int):
+        servers = open_servers()
+        for server in servers:
+            await server.connect()
+        try:
+            accounts, market, _ = servers
+            for server in servers:
+                await server.list_tools()
+            for _ in range(calls):
+                start = time.perf_counter()
+                await market.call_tool("lookup_share_price", {"symbol": "AAPL"})
+                await accounts.call_tool("get_holdings", {"name": f"bench{i}"})
+                latencies.append((time.perf_counter() - start) / 2)
+        finally:
+            for server in reversed(servers):
+                await server.cleanup()
+
+    await asyncio.gather(*[run_trader(i) for i in range(traders)])
+    return latencies
+
+
+def bench_mcp_transport(traders: int = 4, calls: int = 50) -> dict:
+    """Tool-call latency and simulated cycle wall time for stdio vs in-process MCP servers."""
+    from agents.mcp import MCPServerStdio
+    from mcp_inprocess import MCPServerInProcess
+    import accounts_server
+    import market_server
+    import push_server
+
+    scripts = ["accounts_server.py", "market_server.py", "push_server.py"]
+    modes = {
+        "stdio": lambda: [
+            MCPServerStdio(server_params(script).model_dump(), client_session_timeout_seconds=120)
+            for script in scripts
+        ],
+        "inprocess": lambda: [
+            MCPServerInProcess(module.mcp) for module in (accounts_server, market_server, push_server)
+        ],
+    }
+    results = {"traders": traders, "calls_per_trader": calls}
+    for mode, open_servers in modes.items():
+        start = time.perf_counter()
+        latencies = asyncio.run(_simulated_cycle(open_servers, traders, calls))
+        results[mode] = {
+            "cycle_seconds": round(time.perf_counter() - start, 3),
+            "tool_call_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "tool_call_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        }
+    return results
+
+
+class _FakeSpanData:
+    type = "function"
+    name = "lookup_share_price"
+    server = None
+    mcp_data = {"server": "market_server"}
+
+
+class _FakeSpan:
+    """The parts of an agents SDK function span that LogTracer reads"""
+
+    trace_id = "trace_bench0" + "x" * 26
+    span_data = _FakeSpanData()
+    error = None
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.span_id = f"span_{next(self._ids)}"
+
+
+async def _span_burst(tracer, spans: int) -> dict:
+    """Fire a burst of span callbacks from a coroutine while a ticker measures event loop lag"""
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    blocked = 0.0
+    for _ in range(spans // 10):
+        start = time.perf_counter()
+        for _ in range(5):
+            span = _FakeSpan()
+            tracer.on_span_start(span)
+            tracer.on_span_end(span)
+        blocked += time.perf_counter() - start
+        await asyncio.sleep(0)
+    stop.set()
+    await ticking
+    return {"blocked_ms": round(blocked * 1000, 2), "max_loop_lag_ms": round(max(lags) * 1000, 2)}
+
+
+def bench_log_writer(spans: int = 2000) -> dict:
+    """Event loop blocking time for a burst of spans: direct write_log vs the buffered writer."""
+    import tracers
+
+    results = {"spans": spans}
+    buffered = tracers.write_log
+    tracers.write_log = database.write_log
+    results["synchronous"] = asyncio.run(_span_burst(tracers.LogTracer(), spans))
+    tracers.write_log = buffered
+    results["buffered"] = asyncio.run(_span_burst(tracers.LogTracer(), spans))
+    start = time.perf_counter()
+    tracers.LogTracer().force_flush()
+    results["buffered"]["flush_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    results["buffered"]["batches"] = tracers.log_writer.batches
+    results["span_metrics_rows"] = database.get_connection().execute("SELECT COUNT(*) FROM span_metrics").fetchone()[0]
+    return results
+
+
+def bench_log_tail(rows: int = 1_000_000, names: int = 4, polls: int = 200) -> dict:
+    """Dashboard log polling against a table of `rows` logs: full re-sort vs cursor tailing."""
+    conn = database.get_connection()
+    with database.transaction():
+        conn.executemany(
+            "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+            ((f"trader{i % names}", "function", f"Ended function tool {i}") for i in range(rows)),
+        )
+    last_id = database.read_log_since("trader0", 0, 13)[-1][0]
+    polls_per_second = {
+        "legacy_sort_by_datetime": ops_per_second(lambda i: list(legacy_read_log("trader0", 13)), polls),
+        "read_log": ops_per_second(lambda i: list(database.read_log("trader0", 13)), polls),
+        "read_log_since_idle": ops_per_second(
+            lambda i: database.read_log_since("trader0", last_id, 13), polls
+        ),
+    }
+    return {"rows": rows, "polls_per_second": {k: round(v) for k, v in polls_per_second.items()}}
+
+
+def bench_analytics(traders: int = 36, years: int = 3, refreshes: int = 20) -> dict:
+    """Leaderboard analytics over years of rollups: a full load vs an incremental refresh."""
+    from datetime import datetime, timedelta
+    from analytics import PortfolioAnalytics
+
+    now = datetime.now()
+    hours = database.PORTFOLIO_HOURLY_RETENTION_DAYS * 24
+    rows = {
+        "day": [(now - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(years * 365, 0, -1)],
+        "hour": [(now - timedelta(hours=h)).strftime("%Y-%m-%d %H:00:00") for h in range(hours, 0, -1)],
+    }
+    with database.transaction() as conn:
+        for resolution, buckets in rows.items():
+            conn.executemany(
+                f"INSERT INTO portfolio_values_{resolution} VALUES (?, ?, ?, ?, ?, ?, 1)",
+                (
+                    (f"trader{t}", bucket, value, value, value, value)
+                    for t in range(traders)
+                    for i, bucket in enumerate(buckets)
+                    for value in [10_000 + (i * (t + 1)) % 997]
+                ),
+            )
+    results = {"traders": traders}
+    for resolution, buckets in rows.items():
+        analytics = PortfolioAnalytics(resolution)
+        start = time.perf_counter()
+        analytics.refresh()
+        full = time.perf_counter() - start
+        timestamp = now.strftime(database.TIMESTAMP_FORMAT)
+        start = time.perf_counter()
+        for i in range(refreshes):
+            database.write_portfolio_value(f"trader{i % traders}", timestamp, 10_000 + i)
+            analytics.refresh()
+            analytics.leaderboard()
+        incremental = (time.perf_counter() - start) / refreshes
+        results[resolution] = {
+            "points_per_trader": len(buckets),
+            "full_load_ms": round(full * 1000, 1),
+            "incremental_refresh_ms": round(incremental * 1000, 1),
+        }
+    return results
+
+
+SECTORS = ["semiconductors", "banking", "energy", "retail", "biotech", "software", "autos", "media"]
+
+
+# The tables mcp-memory-libsql creates, vector index included
+LIBSQL_MEMORY_SCHEMA = """
+CREATE TABLE entities (
+    name TEXT PRIMARY KEY, entity_type TEXT NOT NULL, embedding F32_BLOB(4), created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, entity_name TEXT NOT NULL, content TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (entity_name) REFERENCES entities(name)
+);
+CREATE TABLE relations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL, target TEXT NOT NULL, relation_type TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_entities_name ON entities(name);
+CREATE TABLE libsql_vector_meta_shadow ( name TEXT PRIMARY KEY, metadata BLOB ) WITHOUT ROWID;
+CREATE TABLE idx_entities_embedding_shadow (index_key INTEGER, data BLOB, PRIMARY KEY (index_key));
+CREATE INDEX idx_entities_embedding ON entities(libsql_vector_idx(embedding));
+INSERT INTO entities (name, entity_type) VALUES ('Nvidia', 'company');
+INSERT INTO observations (entity_name, content) VALUES ('Nvidia', 'Leads in AI accelerators');
+"""
+
+
+def check_libsql_memory_file() -> bool:
+    """
+    Write to a memory file laid out as mcp-memory-libsql leaves it. libsql_vector_idx() is
+    stubbed only while the file is built, as plain SQLite can't create the index otherwise.
+    """
+    from memory_server import KnowledgeGraph, Entity, Observations
+
+    path = os.path.join(SCRATCH_DIR, "libsql_memory.db")
+    conn = sqlite3.connect(path)
+    conn.create_function("libsql_vector_idx", 1, lambda embedding: embedding, deterministic=True)
+    conn.executescript(LIBSQL_MEMORY_SCHEMA)
+    conn.close()
+    graph = KnowledgeGraph(path)
+    graph.create_entities([Entity(name="TSMC", entityType="company", observations=["Makes Nvidia's chips"])])
+    graph.add_observations([Observations(entityName="Nvidia", contents=["Supplied by TSMC"])])
+    found = {entity["name"] for entity in graph.search_nodes("nvidia")["entities"]}
+    assert found == {"Nvidia", "TSMC"}, found
+    return True
+
+
+def bench_memory(entities: int = 100_000, queries: int = 200) -> dict:
+    """Knowledge-graph memory at scale: bulk load, FTS5 search_nodes vs a LIKE scan, open_nodes."""
+    import random
+    from memory_server import KnowledgeGraph, Entity, Relation
+
+    rng = random.Random(7)
+    path = os.path.join(SCRATCH_DIR, "memory.db")
+    graph = KnowledgeGraph(path)
+    start = time.perf_counter()
+    for offset in range(0, entities, 1000):
+        graph.create_entities([
+            Entity(
+                name=f"Company {i}",
+                entityType="company",
+                observations=[
+                    f"Operates in {SECTORS[i % len(SECTORS)]} with ticker T{i}",
+                    f"Reported revenue growth of {i % 40} percent",
+                    f"Analysts mention catalyst {rng.randrange(entities)}",
+                ],
+            )
+            for i in range(offset, min(offset + 1000, entities))
+        ])
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    for offset in range(0, entities, 1000):
+        graph.create_relations([
+            Relation(source=f"Company {i}", target=f"Company {rng.randrange(entities)}", relationType="competes_with")
+            for i in range(offset, min(offset + 1000, entities))
+        ])
+    relate = time.perf_counter() - start
+
+    terms = [f"catalyst {rng.randrange(entities)}" for _ in range(queries)]
+    search, common, scan, open_nodes = [], [], [], []
+    for term in terms:
+        begin = time.perf_counter()
+        graph.search_nodes(term)
+        search.append(time.perf_counter() - begin)
+        begin = time.perf_counter()
+        graph.search_nodes(f"{rng.choice(SECTORS)} revenue growth")
+        common.append(time.perf_counter() - begin)
+        names = [f"Company {rng.randrange(entities)}" for _ in range(10)]
+        begin = time.perf_counter()
+        graph.open_nodes(names)
+        open_nodes.append(time.perf_counter() - begin)
+    for term in terms[:20]:
+        begin = time.perf_counter()
+        graph.conn.execute(
+            "SELECT DISTINCT e.name FROM entities e LEFT JOIN observations o ON o.entity_name = e.name "
+            "WHERE e.name LIKE ? OR e.entity_type LIKE ? OR o.content LIKE ? LIMIT 10",
+            (f"%{term}%",) * 3,
+        ).fetchall()
+        scan.append(time.perf_counter() - begin)
+    fresh = KnowledgeGraph(path)
+    begin = time.perf_counter()
+    fresh.open_nodes(["Company 1"])
+    adjacency_load = time.perf_counter() - begin
+    return {
+        "entities": entities,
+        "observations": entities * 3,
+        "relations": entities,
+        "load_entities_per_sec": round(entities / load),
+        "create_relations_per_sec": round(entities / relate),
+        "search_nodes_p50_ms": round(percentile(search, 50) * 1000, 3),
+        "search_nodes_p99_ms": round(percentile(search, 99) * 1000, 3),
+        "search_nodes_common_words_p50_ms": round(percentile(common, 50) * 1000, 3),
+        "like_scan_p50_ms": round(percentile(scan, 50) * 1000, 3),
+        "open_nodes_10_p50_ms": round(percentile(open_nodes, 50) * 1000, 3),
+        "adjacency_cold_load_ms": round(adjacency_load * 1000, 1),
+        "db_mb": round(os.path.getsize(path) / 2**20, 1),
+        "libsql_file_writable": check_libsql_memory_file(),
+    }
+
+
+class ConstantPrices:
+    """A market replay for market.set_replay that prices every symbol the same"""
+
+    def __init__(self, price: float):
+        self.price = price
+
+    def prices(self, symbols: list[str]) -> dict[str, float]:
+        return {symbol: self.price for symbol in symbols}
+
+    def is_open(self) -> bool:
+        return True
+
+
+def bench_account_conflicts(buyers: int = 16, buys: int = 25, price: float = 10.0) -> dict:
+    """Many threads buying one share at a time in one account: no update may be lost to a race."""
+    import threading
+    import market
+    from accounts import INITIAL_BALANCE, SPREAD, Account, account_conflict_stats, update_account
+
+    market.set_replay(ConstantPrices(price))
+    update_account("contended", lambda account: account.reset(""))
+    before = account_conflict_stats()
+    errors = []
+
+    def buyer(i: int):
+        try:
+            for j in range(buys):
+                update_account("contended", lambda account: account.buy_shares("AAPL", 1, f"buyer {i} buy {j}"))
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(buyers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    market.set_replay(None)
+
+    account = Account.get("contended")
+    expected = buyers * buys
+    after = account_conflict_stats()
+    assert not errors, errors[:3]
+    assert account.holdings == {"AAPL": expected}, account.holdings
+    assert len(account.transactions) == expected, len(account.transactions)
+    assert abs(account.balance - (INITIAL_BALANCE - expected * price * (1 + SPREAD))) < 1e-6, account.balance
+    assert account.rebuild_ledger(), "the stored ledger disagrees with the transactions"
+    return {
+        "buyers": buyers,
+        "buys": expected,
+        "lost_updates": 0,
+        "buys_per_sec": round(expected / elapsed, 1),
+        "conflicts": after["conflicts"] - before["conflicts"],
+        "retries": after["retries"] - before["retries"],
+        "exhausted": after["exhausted"] - before["exhausted"],
+        "final_version": account.version,
+    }
+
+
+BENCHMARKS = {
+    "database": bench_database,
+    "accounts_client": bench_accounts_client,
+    "mcp_transport": bench_mcp_transport,
+    "log_writer": bench_log_writer,
+    "log_tail": bench_log_tail,
+    "analytics": bench_analytics,
+    "memory": bench_memory,
+    "account_conflicts": bench_account_conflicts,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trading floor micro-benchmarks")
+    parser.add_argument("benchmark", choices=[*BENCHMARKS, "all"])
+    args = parser.parse_args(argv)
+    selected = BENCHMARKS if args.benchmark == "all" else {args.benchmark: BENCHMARKS[args.benchmark]}
+    results = {name: fn() for name, fn in selected.items()}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+The trading floor's notion of the current time.
+
+Everything that stamps or checks "now" (transactions, portfolio values, logs, prompts, the
+end-of-day market date) asks this module, so a backtest can run the floor on a simulated
+clock by installing its own time source with set_clock.
+"""
+
+from datetime import datetime
+from typing import Callable
+
+_source: Callable[[], datetime] = datetime.now
+
+
+def now() -> datetime:
+    return _source()
+
+
+def set_clock(source: Callable[[], datetime] | None) -> None:
+    """Install a time source returning naive local datetimes; None restores the wall clock"""
+    global _source
+    _source = source or datetime.now
@@ -1,16 +1,202 @@
+import os
 import sqlite3
 import json
-from datetime import datetime
+import threading
+import atexit
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import clock
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
 
+# Durability vs speed: NORMAL is safe against corruption in WAL mode and only risks the
+# last few commits on power loss; use FULL for strict durability or OFF for throwaway runs
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").strip().upper()
+DB_BUSY_TIMEOUT_SECONDS = float(os.getenv("DB_BUSY_TIMEOUT_SECONDS", "30"))
+DB_STATEMENT_CACHE_SIZE = 256
 
-with sqlite3.connect(DB) as conn:
+# Retention tiers for portfolio values: every point is kept for PORTFOLIO_RAW_RETENTION_HOURS,
+# hourly OHLC rollups for PORTFOLIO_HOURLY_RETENTION_DAYS, and daily OHLC rollups forever
+PORTFOLIO_RAW_RETENTION_HOURS = int(os.getenv("PORTFOLIO_RAW_RETENTION_HOURS", "48"))
+PORTFOLIO_HOURLY_RETENTION_DAYS = int(os.getenv("PORTFOLIO_HOURLY_RETENTION_DAYS", "90"))
+RESOLUTIONS = ("raw", "hour", "day")
+# Span durations recorded by the LogTracer are kept for SPAN_METRICS_RETENTION_DAYS
+SPAN_METRICS_RETENTION_DAYS = int(os.getenv("SPAN_METRICS_RETENTION_DAYS", "14"))
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Unsupported DB_SYNCHRONOUS level {DB_SYNCHRONOUS}")
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_lock_stats = {"transactions": 0, "lock_wait_seconds": 0.0, "max_lock_wait_seconds": 0.0}
+
+
+class StaleAccountError(RuntimeError):
+    """An account write expected a version of the account that another writer has since replaced"""
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB,
+        timeout=DB_BUSY_TIMEOUT_SECONDS,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_SECONDS * 1000)}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the long-lived connection for the current thread, opening it on first use.
+
+    Each thread of each process gets its own connection, so the MCP servers, the tracer
+    and the Gradio worker threads never share a sqlite3 handle. WAL mode lets all of them
+    read while one of them writes, and the busy timeout queues writers instead of failing.
+    Statements are compiled once per connection and reused from sqlite3's statement cache.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements in one write transaction on this thread's connection.
+
+    The write lock is taken up front with BEGIN IMMEDIATE so concurrent writers wait on the
+    busy timeout rather than failing mid-transaction. Nested use joins the outer transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    waited = time.perf_counter() - start
+    with _connections_lock:
+        _lock_stats["transactions"] += 1
+        _lock_stats["lock_wait_seconds"] += waited
+        _lock_stats["max_lock_wait_seconds"] = max(_lock_stats["max_lock_wait_seconds"], waited)
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextmanager
+def snapshot():
+    """
+    Run the enclosed reads against one consistent snapshot of the database, so a multi-table
+    read never sees half of a concurrent write. Inside a write transaction, reads use that.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("COMMIT")
+
+
+def lock_wait_stats() -> dict:
+    """How long this process's write transactions have waited for the database write lock"""
+    with _connections_lock:
+        return dict(_lock_stats)
+
+
+@atexit.register
+def close_connections() -> None:
+    """Close every connection opened by this process."""
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+with transaction() as conn:
     cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            account TEXT,
+            balance REAL,
+            strategy TEXT,
+            ledger TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(accounts)')}
+    for column, column_type in (
+        ("balance", "REAL"), ("strategy", "TEXT"), ("ledger", "TEXT"), ("version", "INTEGER NOT NULL DEFAULT 0")
+    ):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE accounts ADD COLUMN {column} {column_type}')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            PRIMARY KEY (name, symbol)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            price REAL,
+            timestamp TEXT,
+            rationale TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS transactions_name_id ON transactions (name, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime TEXT,
+            value REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS portfolio_values_name_datetime ON portfolio_values (name, datetime)')
+    for resolution in ("hour", "day"):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS portfolio_values_{resolution} (
+                name TEXT,
+                bucket TEXT,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                points INTEGER,
+                PRIMARY KEY (name, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS portfolio_values_{resolution}_bucket ON portfolio_values_{resolution} (bucket)'
+        )
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -20,27 +206,352 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS logs_name_id ON logs (name, id)')
     cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS span_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            trace_id TEXT,
+            span_type TEXT,
+            label TEXT,
+            server TEXT,
+            model TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            started TEXT,
+            duration_ms REAL,
+            error INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS span_metrics_started ON span_metrics (started)')
 
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
 
-def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+def _write_account_rows(conn, name, account_dict):
+    ledger = account_dict.get("ledger")
+    conn.execute('''
+        INSERT INTO accounts (name, account, balance, strategy, ledger)
+        VALUES (?, NULL, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            account=NULL, balance=excluded.balance, strategy=excluded.strategy, ledger=excluded.ledger
+    ''', (name, account_dict["balance"], account_dict["strategy"], json.dumps(ledger) if ledger else None))
+    conn.execute('DELETE FROM holdings WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO holdings (name, symbol, quantity) VALUES (?, ?, ?)',
+        [(name, symbol, quantity) for symbol, quantity in account_dict["holdings"].items()],
+    )
+    conn.execute('DELETE FROM transactions WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            for t in account_dict["transactions"]
+        ],
+    )
+    conn.execute('DELETE FROM portfolio_values WHERE name = ?', (name,))
+    conn.execute('DELETE FROM portfolio_values_hour WHERE name = ?', (name,))
+    conn.execute('DELETE FROM portfolio_values_day WHERE name = ?', (name,))
+    for timestamp, value in account_dict["portfolio_value_time_series"]:
+        _add_portfolio_value(conn, name, timestamp, value)
+
+
+def _migrate_account_blobs(conn):
+    """Move accounts still stored as a single JSON blob into the normalized tables."""
+    rows = conn.execute('SELECT name, account FROM accounts WHERE account IS NOT NULL').fetchall()
+    for name, account_json in rows:
+        _write_account_rows(conn, name, json.loads(account_json))
+
+
+def _update_account(conn, name: str, version: int | None, **columns) -> None:
+    """
+    Set columns of the account row and advance its version. Given the version the writer read,
+    this is a compare-and-swap: it raises StaleAccountError, rolling back the enclosing
+    transaction, if another write has advanced the version since.
+    """
+    assignments = [f"{column} = ?" for column in columns] + ["version = version + 1"]
+    query = f'UPDATE accounts SET {", ".join(assignments)} WHERE name = ?'
+    params = [*columns.values(), name]
+    if version is not None:
+        query += ' AND version = ?'
+        params.append(version)
+    if not conn.execute(query, params).rowcount and version is not None:
+        raise StaleAccountError(f"Account {name} has been changed since version {version} was read")
+
+def create_account(name, account_dict) -> bool:
+    """Store a new account at version 0; return False, writing nothing, if it already exists"""
+    name = name.lower()
+    with transaction() as conn:
+        if conn.execute('SELECT 1 FROM accounts WHERE name = ?', (name,)).fetchone():
+            return False
+        _write_account_rows(conn, name, account_dict)
+        return True
+
+def write_account(name, account_dict, version: int | None = None):
+    """
+    Replace the whole stored account, including its holdings, transactions and time series.
+    Day-to-day changes should use the targeted writes below, which cost the same however old
+    the account is. Like them, it checks and advances the account's version.
+    """
+    name = name.lower()
+    with transaction() as conn:
+        _write_account_rows(conn, name, account_dict)
+        _update_account(conn, name, version)
+
+def read_account_names() -> list[str]:
+    with snapshot() as conn:
+        return [name for (name,) in conn.execute('SELECT name FROM accounts ORDER BY name')]
+
+def read_account(name, transactions_limit: int | None = None):
+    """
+    Read an account, with its whole history unless transactions_limit is given. A limited read
+    loads only the latest transactions_limit transactions, plus a transaction_count of all of
+    them, and no portfolio value time series, so it costs the same however old the account is.
+    """
+    name = name.lower()
+    with snapshot() as conn:
+        return _read_account(conn.cursor(), name, transactions_limit)
+
+def _read_account(cursor, name, transactions_limit: int | None = None):
+    cursor.execute('SELECT balance, strategy, ledger, version FROM accounts WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    balance, strategy, ledger, version = row
+    holdings = dict(cursor.execute('SELECT symbol, quantity FROM holdings WHERE name = ?', (name,)))
+    account = {
+        "name": name,
+        "balance": balance,
+        "strategy": strategy,
+        "holdings": holdings,
+        "ledger": json.loads(ledger) if ledger else None,
+        "version": version,
+    }
+    if transactions_limit is not None:
+        rows = cursor.execute('''
+            SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+            WHERE name = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (name, transactions_limit)).fetchall()[::-1]
+        account["transaction_count"] = cursor.execute(
+            'SELECT COUNT(*) FROM transactions WHERE name = ?', (name,)
+        ).fetchone()[0]
+        portfolio_value_time_series = []
+    else:
+        rows = cursor.execute('''
+            SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+            WHERE name = ?
+            ORDER BY id
+        ''', (name,)).fetchall()
+        portfolio_value_time_series = cursor.execute(
+            'SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY datetime', (name,)
+        ).fetchall()
+    account["transactions"] = [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in rows
+    ]
+    account["portfolio_value_time_series"] = portfolio_value_time_series
+    return account
+
+def write_balance(name: str, balance: float, version: int | None = None) -> None:
+    with transaction() as conn:
+        _update_account(conn, name.lower(), version, balance=balance)
+
+def write_strategy(name: str, strategy: str, version: int | None = None) -> None:
+    with transaction() as conn:
+        _update_account(conn, name.lower(), version, strategy=strategy)
+
+def write_ledger(name: str, ledger: dict, version: int | None = None) -> None:
+    with transaction() as conn:
+        _update_account(conn, name.lower(), version, ledger=json.dumps(ledger))
+
+def write_trade(
+    name: str,
+    balance: float,
+    symbol: str,
+    quantity_held: int,
+    transaction_dict: dict,
+    ledger: dict,
+    version: int | None = None,
+) -> None:
+    """Record a single trade; see write_trades"""
+    write_trades(name, balance, {symbol: quantity_held}, [transaction_dict], ledger, version)
+
+def write_trades(
+    name: str,
+    balance: float,
+    positions: dict[str, int],
+    transaction_dicts: list[dict],
+    ledger: dict,
+    version: int | None = None,
+) -> None:
+    """
+    Record a batch of trades as one transaction: the final cash balance and ledger, the final
+    position in each traded symbol (removed when it reaches zero) and every transaction row.
+    """
+    name = name.lower()
+    with transaction() as conn:
+        _update_account(conn, name, version, balance=balance, ledger=json.dumps(ledger))
+        conn.executemany('''
+            INSERT INTO holdings (name, symbol, quantity)
+            VALUES (?, ?, ?)
+            ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity
+        ''', [(name, symbol, quantity) for symbol, quantity in positions.items() if quantity])
+        conn.executemany(
+            'DELETE FROM holdings WHERE name = ? AND symbol = ?',
+            [(name, symbol) for symbol, quantity in positions.items() if not quantity],
+        )
+        conn.executemany('''
+            INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            for t in transaction_dicts
+        ])
+
+def _bucket(timestamp: str, resolution: str) -> str:
+    if resolution == "hour":
+        return timestamp[:13] + ":00:00"
+    if resolution == "day":
+        return timestamp[:10]
+    return timestamp
+
+def _add_portfolio_value(conn, name, timestamp, value):
+    conn.execute(
+        'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)',
+        (name, timestamp, value),
+    )
+    for resolution in ("hour", "day"):
+        conn.execute(f'''
+            INSERT INTO portfolio_values_{resolution} (name, bucket, open, high, low, close, points)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(name, bucket) DO UPDATE SET
+                high=max(high, excluded.high),
+                low=min(low, excluded.low),
+                close=excluded.close,
+                points=points + 1
+        ''', (name, _bucket(timestamp, resolution), value, value, value, value))
+    latest = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    raw_cutoff = latest - timedelta(hours=PORTFOLIO_RAW_RETENTION_HOURS)
+    hourly_cutoff = latest - timedelta(days=PORTFOLIO_HOURLY_RETENTION_DAYS)
+    conn.execute(
+        'DELETE FROM portfolio_values WHERE name = ? AND datetime < ?',
+        (name, raw_cutoff.strftime(TIMESTAMP_FORMAT)),
+    )
+    conn.execute(
+        'DELETE FROM portfolio_values_hour WHERE name = ? AND bucket < ?',
+        (name, _bucket(hourly_cutoff.strftime(TIMESTAMP_FORMAT), "hour")),
+    )
+
+def write_portfolio_value(name: str, timestamp: str, value: float) -> None:
+    """
+    Append a portfolio value point, fold it into the hourly and daily OHLC rollups, and
+    expire raw points and hourly rollups that have aged out of their retention tier.
+    """
+    with transaction() as conn:
+        _add_portfolio_value(conn, name.lower(), timestamp, value)
+
+def _resolve_resolution(conn, name: str, start: str | None) -> str:
+    if start is None:
+        row = conn.execute('SELECT min(bucket) FROM portfolio_values_day WHERE name = ?', (name,)).fetchone()
+        start = row[0] or ""
+    now = clock.now()
+    if start >= (now - timedelta(hours=PORTFOLIO_RAW_RETENTION_HOURS)).strftime(TIMESTAMP_FORMAT):
+        return "raw"
+    if start >= (now - timedelta(days=PORTFOLIO_HOURLY_RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT):
+        return "hour"
+    return "day"
+
+def read_portfolio_values(
+    name: str, start: str | None = None, end: str | None = None, resolution: str = "auto"
+) -> list[tuple[str, float, float, float, float]]:
+    """
+    Read an account's portfolio value history between two timestamps.
+
+    Args:
+        name (str): The account name
+        start (str): Earliest timestamp to include, as "YYYY-MM-DD HH:MM:SS"; None for all history
+        end (str): Latest timestamp to include; None for up to now
+        resolution (str): "raw", "hour", "day", or "auto" for the finest tier that covers the range
+
+    Returns:
+        list: (timestamp, open, high, low, close) tuples in time order; raw points repeat the value
+    """
+    name = name.lower()
+    conn = get_connection()
+    if resolution == "auto":
+        resolution = _resolve_resolution(conn, name, start)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution}; expected one of {RESOLUTIONS} or auto")
+    start = _bucket(start, resolution) if start else ""
+    end = end or "9999"
+    if resolution == "raw":
+        rows = conn.execute('''
+            SELECT datetime, value FROM portfolio_values
+            WHERE name = ? AND datetime >= ? AND datetime <= ?
+            ORDER BY datetime
+        ''', (name, start, end))
+        return [(timestamp, value, value, value, value) for timestamp, value in rows]
+    return conn.execute(f'''
+        SELECT bucket, open, high, low, close FROM portfolio_values_{resolution}
+        WHERE name = ? AND bucket >= ? AND bucket <= ?
+        ORDER BY bucket
+    ''', (name, start, end)).fetchall()
+
+def read_portfolio_closes(start: str = "", resolution: str = "day") -> list[tuple[str, str, float]]:
+    """
+    Read every account's closing portfolio value per bucket, from a bucket onwards.
+
+    Args:
+        start (str): Earliest bucket to include; "" for all history
+        resolution (str): "hour" or "day"
+
+    Returns:
+        list: (name, bucket, close) tuples ordered by name, then bucket
+    """
+    if resolution not in ("hour", "day"):
+        raise ValueError(f"Unknown rollup resolution {resolution}; expected hour or day")
+    return get_connection().execute(f'''
+        SELECT name, bucket, close FROM portfolio_values_{resolution}
+        WHERE bucket >= ?
+        ORDER BY name, bucket
+    ''', (start,)).fetchall()
+
+def read_transactions_page(name: str, before_id: int | None = None, limit: int = 20) -> list[dict]:
+    """
+    Read one page of an account's transactions, newest first, for cursor pagination.
+
+    Args:
+        before_id: Only return transactions older than this id (the previous page's last id)
+        limit: The most transactions to return
+
+    Returns:
+        list: Transaction dicts, each with its id
+    """
+    rows = get_connection().execute('''
+        SELECT id, symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), before_id if before_id is not None else 2**63 - 1, limit))
+    return [
+        {"id": id, "symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for id, symbol, quantity, price, timestamp, rationale in rows
+    ]
+
+def read_transactions_since(last_id: int = 0) -> list[tuple[int, str, str, int, float]]:
+    """
+    Read every account's transactions written after a cursor, for incremental analytics.
+
+    Returns:
+        list: (id, name, symbol, quantity, price) tuples, oldest first
+    """
+    return get_connection().execute('''
+        SELECT id, name, symbol, quantity, price FROM transactions
+        WHERE id > ?
+        ORDER BY id
+    ''', (last_id,)).fetchall()
+
 def write_log(name: str, type: str, message: str):
     """
     Write a log entry to the logs table.
@@ -50,15 +561,58 @@ def write_log(name: str, type: str, message: str):
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO logs (name, datetime, type, message)
             VALUES (?, datetime('now'), ?, ?)
         ''', (name.lower(), type, message))
-        conn.commit()
+
+def write_logs(entries: list[tuple[str, str, str, str]]):
+    """
+    Write a batch of log entries in a single transaction.
+
+    Args:
+        entries (list): (name, datetime, type, message) tuples, datetime in UTC as "YYYY-MM-DD HH:MM:SS"
+    """
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO logs (name, datetime, type, message)
+            VALUES (?, ?, ?, ?)
+        ''', [(name.lower(), when, type, message) for name, when, type, message in entries])
+
+SPAN_METRIC_COLUMNS = (
+    "name", "trace_id", "span_type", "label", "server", "model",
+    "input_tokens", "output_tokens", "started", "duration_ms", "error",
+)
+
+def write_span_metrics(entries: list[tuple]):
+    """
+    Write a batch of span durations in a single transaction, dropping those past retention.
+
+    Args:
+        entries (list): tuples in SPAN_METRIC_COLUMNS order, started in UTC as "YYYY-MM-DD HH:MM:SS"
+    """
+    if not entries:
+        return
+    latest = max(entry[8] for entry in entries)
+    cutoff = datetime.strptime(latest, TIMESTAMP_FORMAT) - timedelta(days=SPAN_METRICS_RETENTION_DAYS)
+    with transaction() as conn:
+        conn.executemany(f'''
+            INSERT INTO span_metrics ({", ".join(SPAN_METRIC_COLUMNS)})
+            VALUES ({", ".join("?" * len(SPAN_METRIC_COLUMNS))})
+        ''', [(entry[0].lower(), *entry[1:]) for entry in entries])
+        conn.execute('DELETE FROM span_metrics WHERE started < ?', (cutoff.strftime(TIMESTAMP_FORMAT),))
+
+def read_span_metrics(since: str = "", name: str | None = None) -> list[tuple]:
+    """Span durations started at or after since (UTC), as tuples in SPAN_METRIC_COLUMNS order"""
+    conn = get_connection()
+    query = f'SELECT {", ".join(SPAN_METRIC_COLUMNS)} FROM span_metrics WHERE started >= ?'
+    params = [since]
+    if name:
+        query += ' AND name = ?'
+        params.append(name.lower())
+    return conn.execute(query + ' ORDER BY id', params).fetchall()
 
 def read_log(name: str, last_n=10):
     """
@@ -71,31 +625,74 @@ def read_log(name: str, last_n=10):
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT datetime, type, message FROM logs 
+        WHERE name = ? 
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    
+    return reversed(cursor.fetchall())
+
+def read_log_since(name: str, last_id: int = 0, last_n=10):
+    """
+    Read the log entries for a given name written after a cursor, for incremental tailing.
+    When more than last_n entries are new, only the most recent last_n are returned.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry already seen; 0 for none
+        last_n (int): Maximum number of entries to retrieve
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first;
+        the last id is the cursor for the next call
+    """
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_id, last_n)).fetchall()
+    rows.reverse()
+    return rows
 
 def write_market(date: str, data: dict) -> None:
     data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO market (date, data)
             VALUES (?, ?)
             ON CONFLICT(date) DO UPDATE SET data=excluded.data
         ''', (date, data_json))
-        conn.commit()
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _backfill_portfolio_rollups(conn):
+    """Build the hourly and daily rollups for raw portfolio values written before they existed."""
+    names = [row[0] for row in conn.execute('''
+        SELECT DISTINCT name FROM portfolio_values
+        WHERE name NOT IN (SELECT name FROM portfolio_values_day)
+    ''')]
+    for name in names:
+        points = conn.execute(
+            'SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY datetime', (name,)
+        ).fetchall()
+        conn.execute('DELETE FROM portfolio_values WHERE name = ?', (name,))
+        for timestamp, value in points:
+            _add_portfolio_value(conn, name, timestamp, value)
+
+
+with transaction() as conn:
+    _migrate_account_blobs(conn)
+    _backfill_portfolio_rollups(conn)
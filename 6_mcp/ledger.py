@@ -0,0 +1,118 @@
+from pydantic import BaseModel, Field, field_validator
+
+COST_BASIS_MODES = ("average", "fifo")
+
+
+def check_mode(mode: str) -> str:
+    if mode not in COST_BASIS_MODES:
+        raise ValueError(f"Unknown cost basis mode {mode}; expected one of {COST_BASIS_MODES}")
+    return mode
+
+
+def _close(a: float, b: float, tolerance: float = 1e-9) -> bool:
+    return abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+
+
+class Position(BaseModel):
+    quantity: int = 0
+    cost_basis: float = 0.0
+    lots: list[tuple[int, float]] = Field(default_factory=list)
+
+    def average_cost(self) -> float:
+        return self.cost_basis / self.quantity if self.quantity else 0.0
+
+
+class Ledger(BaseModel):
+    """
+    Running cost basis, realized P&L and cash flow for an account, updated per trade.
+
+    Applying a trade only touches the traded symbol's position, so every P&L query is
+    constant-time however long the transaction history is. In "average" mode a sale releases
+    cost at the position's average price; in "fifo" mode it consumes the oldest lots first.
+    """
+
+    mode: str = "average"
+    bought: float = 0.0
+    sold: float = 0.0
+    realized_pnl: float = 0.0
+    positions: dict[str, Position] = Field(default_factory=dict)
+
+    @field_validator("mode")
+    @classmethod
+    def _check_mode(cls, mode: str) -> str:
+        return check_mode(mode)
+
+    @property
+    def net_trade_spend(self) -> float:
+        return self.bought - self.sold
+
+    def apply(self, symbol: str, quantity: int, price: float) -> None:
+        """Apply one trade; quantity is negative for a sale, as in Transaction"""
+        position = self.positions.setdefault(symbol, Position())
+        if quantity > 0:
+            self.bought += quantity * price
+            position.quantity += quantity
+            position.cost_basis += quantity * price
+            if self.mode == "fifo":
+                position.lots.append((quantity, price))
+        elif quantity < 0:
+            sold = -quantity
+            self.sold += sold * price
+            released = self._release_fifo(position, sold) if self.mode == "fifo" else position.average_cost() * sold
+            self.realized_pnl += sold * price - released
+            position.quantity -= sold
+            position.cost_basis -= released
+        if position.quantity == 0:
+            del self.positions[symbol]
+
+    def _release_fifo(self, position: Position, quantity: int) -> float:
+        released = 0.0
+        while quantity and position.lots:
+            lot_quantity, lot_price = position.lots[0]
+            used = min(lot_quantity, quantity)
+            released += used * lot_price
+            quantity -= used
+            if used == lot_quantity:
+                position.lots.pop(0)
+            else:
+                position.lots[0] = (lot_quantity - used, lot_price)
+        return released
+
+    def cost_basis(self) -> float:
+        return sum(position.cost_basis for position in self.positions.values())
+
+    def unrealized_pnl(self, prices: dict[str, float]) -> float:
+        return sum(
+            prices[symbol] * position.quantity - position.cost_basis
+            for symbol, position in self.positions.items()
+        )
+
+    @classmethod
+    def rebuild(cls, transactions, mode: str = "average") -> "Ledger":
+        """Replay a transaction history from scratch, for migration and consistency checks"""
+        ledger = cls(mode=check_mode(mode))
+        for transaction in transactions:
+            ledger.apply(transaction.symbol, transaction.quantity, transaction.price)
+        return ledger
+
+    def matches(self, other: "Ledger") -> bool:
+        """Whether two ledgers agree: same mode, totals and positions, down to the FIFO lots"""
+        if self.mode != other.mode:
+            return False
+        totals = ("bought", "sold", "realized_pnl")
+        if not all(_close(getattr(self, total), getattr(other, total)) for total in totals):
+            return False
+        if self.positions.keys() != other.positions.keys():
+            return False
+        return all(
+            _positions_match(position, other.positions[symbol]) for symbol, position in self.positions.items()
+        )
+
+
+def _positions_match(a: Position, b: Position) -> bool:
+    if a.quantity != b.quantity or not _close(a.cost_basis, b.cost_basis) or len(a.lots) != len(b.lots):
+        return False
+    return all(
+        a_quantity == b_quantity and _close(a_price, b_price)
+        for (a_quantity, a_price), (b_quantity, b_price) in zip(a.lots, b.lots)
+    )
@@ -0,0 +1,240 @@
+"""
+Load test of the trading floor with any number of synthetic traders.
+
+    uv run loadtest.py --traders 100 --cycles 3
+
+Each synthetic trader is a real agent whose model is a fake that makes scripted tool calls:
+it fetches its account report, buys a share, sells it back, then checks its balance and
+holdings, all against the accounts and market MCP servers mounted in process on a scratch
+database. Spans are logged through the LogTracer, and a dashboard thread keeps refreshing
+every trader's view while the floor runs, so the database sees the production mix of
+writers and readers. Prices are a constant, so no market data API is called.
+
+Results are printed as one JSON object, to compare between versions.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import atexit
+import string
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="trading_floor_loadtest_")
+os.environ["ACCOUNTS_DB"] = os.path.join(SCRATCH_DIR, "accounts.db")
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+
+from agents import Agent, Runner, trace, set_trace_processors  # noqa: E402  (after ACCOUNTS_DB is set)
+import database  # noqa: E402
+import market  # noqa: E402
+import accounts_server  # noqa: E402
+import market_server  # noqa: E402
+from mcp_inprocess import MCPServerInProcess  # noqa: E402
+from scripted_model import ScriptedModel, message, tool_call, tool_history  # noqa: E402
+from tracers import LogTracer, log_writer, make_trace_id  # noqa: E402
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOG", "META", "TSLA", "JPM"]
+
+
+def trader_name(i: int) -> str:
+    """Letters only, as the LogTracer takes everything before the first "0" in a trace id"""
+    letters = ""
+    i += 1
+    while i:
+        i, remainder = divmod(i - 1, 26)
+        letters = string.ascii_lowercase[remainder] + letters
+    return f"synth{letters}"
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def max_rss_bytes() -> int:
+    """Peak resident set size; Linux reports it in KiB, macOS in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class ConstantPrices:
+    """A market replay for market.set_replay: every symbol costs 100 and the market is open"""
+
+    def prices(self, symbols: list[str]) -> dict[str, float]:
+        return {symbol: 100.0 for symbol in symbols}
+
+    def is_open(self) -> bool:
+        return True
+
+
+class TimedServer(MCPServerInProcess):
+    """An in-process MCP server that records the latency of every tool call"""
+
+    def __init__(self, server, latencies: dict[str, list[float]]):
+        super().__init__(server)
+        self.latencies = latencies
+
+    async def call_tool(self, tool_name, arguments):
+        start = time.perf_counter()
+        try:
+            return await super().call_tool(tool_name, arguments)
+        finally:
+            self.latencies.setdefault(tool_name, []).append(time.perf_counter() - start)
+
+
+class ScriptedToolModel(ScriptedModel):
+    """A fake model that buys one share, sells it, checks balance and holdings, and stops"""
+
+    def __init__(self, account_name: str, symbol: str):
+        self.account_name = account_name
+        self.symbol = symbol
+
+    def respond(self, input) -> list:
+        _, results = tool_history(input)
+        step = len(results)
+        trade = {"name": self.account_name, "symbol": self.symbol, "quantity": 1, "rationale": "Load test"}
+        if step == 0:
+            return [tool_call(f"call_{step}_buy_shares", "buy_shares", **trade)]
+        if step == 1:
+            return [tool_call(f"call_{step}_sell_shares", "sell_shares", **trade)]
+        if step == 2:
+            return [
+                tool_call(f"call_{step}_get_balance", "get_balance", name=self.account_name),
+                tool_call(f"call_{step}_get_holdings", "get_holdings", name=self.account_name),
+            ]
+        return [message("Done")]
+
+
+class DashboardLoad:
+    """Refreshes the dashboard's shared view of every trader back to back on a thread"""
+
+    def __init__(self, names: list[str]):
+        from app import DashboardCache, Trader
+
+        self.cache = DashboardCache([Trader(name, "Synthetic", "scripted") for name in names])
+        self.refreshes: list[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dashboard-load", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            self.cache.refresh()
+            self.refreshes.append(time.perf_counter() - start)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+async def run_load(traders: int, cycles: int, concurrency: int | None, dashboard: bool) -> dict:
+    names = [trader_name(i) for i in range(traders)]
+    latencies: dict[str, list[float]] = {}
+    errors = 0
+    set_trace_processors([LogTracer()])
+    market.set_replay(ConstantPrices())
+
+    viewer = DashboardLoad(names) if dashboard else None
+    rss_before = max_rss_bytes()
+    servers = [TimedServer(accounts_server.mcp, latencies), TimedServer(market_server.mcp, latencies)]
+    agents = [
+        Agent(
+            name=name,
+            instructions=f"You are {name}, a synthetic trader.",
+            model=ScriptedToolModel(name, SYMBOLS[i % len(SYMBOLS)]),
+            mcp_servers=servers,
+        )
+        for i, name in enumerate(names)
+    ]
+    for name in names:
+        await accounts_server.read_account_resource(name)
+    if viewer:
+        viewer.start()
+    semaphore = asyncio.Semaphore(concurrency or traders)
+
+    async def run_trader(agent: Agent):
+        nonlocal errors
+        async with semaphore:
+            try:
+                with trace(f"{agent.name}-trading", trace_id=make_trace_id(agent.name)):
+                    start = time.perf_counter()
+                    await accounts_server.read_account_resource(agent.name)
+                    latencies.setdefault("report", []).append(time.perf_counter() - start)
+                    await Runner.run(agent, "Trade now.", max_turns=10)
+            except Exception as e:
+                errors += 1
+                print(f"Error running {agent.name}: {e}", file=sys.stderr)
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        await asyncio.gather(*[run_trader(agent) for agent in agents])
+    elapsed = time.perf_counter() - start
+    log_writer.flush()
+    if viewer:
+        viewer.stop()
+    market.set_replay(None)
+    rss_growth = max(0, max_rss_bytes() - rss_before)
+
+    tool_calls = sum(len(values) for name, values in latencies.items() if name != "report")
+    lock_waits = database.lock_wait_stats()
+    return {
+        "traders": traders,
+        "cycles": cycles,
+        "concurrency": concurrency or traders,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": {
+            "trader_runs_per_second": round(traders * cycles / elapsed, 2),
+            "tool_calls_per_second": round(tool_calls / elapsed, 2),
+        },
+        "latency_ms": {
+            name: {
+                "calls": len(values),
+                "p50": round(percentile(values, 50) * 1000, 3),
+                "p99": round(percentile(values, 99) * 1000, 3),
+            }
+            for name, values in sorted(latencies.items())
+        },
+        "sqlite": {
+            "write_transactions": lock_waits["transactions"],
+            "lock_wait_seconds": round(lock_waits["lock_wait_seconds"], 3),
+            "max_lock_wait_ms": round(lock_waits["max_lock_wait_seconds"] * 1000, 3),
+        },
+        "tracer": {"log_batches": log_writer.batches, "log_rows": log_writer.rows},
+        "dashboard": None if not viewer else {
+            "refreshes": len(viewer.refreshes),
+            "refresh_p50_seconds": percentile(viewer.refreshes, 50),
+            "refresh_max_seconds": max(viewer.refreshes, default=None),
+        },
+        "memory": {
+            "peak_rss_growth_mb": round(rss_growth / 2**20, 1),
+            "per_trader_kb": round(rss_growth / traders / 1024, 1),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trading floor load test with synthetic traders")
+    parser.add_argument("--traders", type=int, default=100)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, help="Most traders running at once (default: all)")
+    parser.add_argument("--no-dashboard", action="store_true", help="Don't refresh the dashboard during the run")
+    args = parser.parse_args(argv)
+    results = asyncio.run(run_load(args.traders, args.cycles, args.concurrency, not args.no_dashboard))
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 from polygon import RESTClient
 from dotenv import load_dotenv
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import random
-from database import write_market, read_market
+import threading
+import time
+from concurrent.futures import Future
+from database import DB, write_market, read_market
+from market_snapshot import MarketSnapshot, write_snapshot
 from functools import lru_cache
 from datetime import timezone
+import clock
 
 load_dotenv(override=True)
 
@@ -15,16 +20,131 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# How long a snapshot price stays fresh: the paid plan's data is 15 minutes delayed anyway,
+# while realtime prices go stale quickly. PRICE_CACHE_TTL_SECONDS overrides the plan default.
+PRICE_CACHE_TTL_DEFAULTS = {"paid": 60.0, "realtime": 5.0}
+PRICE_CACHE_TTL_SECONDS = float(
+    os.getenv("PRICE_CACHE_TTL_SECONDS", PRICE_CACHE_TTL_DEFAULTS.get(polygon_plan, 60.0))
+)
+MARKET_STATUS_TTL_SECONDS = float(os.getenv("MARKET_STATUS_TTL_SECONDS", "60"))
+MARKET_SNAPSHOT_DIR = os.getenv(
+    "MARKET_SNAPSHOT_DIR", os.path.join(os.path.dirname(DB), "market_snapshots")
+)
+# Snapshots more than this many days older than the one being written are deleted
+MARKET_SNAPSHOT_RETENTION_DAYS = int(os.getenv("MARKET_SNAPSHOT_RETENTION_DAYS", "7"))
+
+
+class PriceCache:
+    """
+    Process-wide TTL cache of share prices.
+
+    Concurrent lookups of a symbol that is already being fetched wait for that request
+    instead of issuing their own, and only the symbols that are missing or stale are fetched.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols: list[str], fetch) -> dict[str, float]:
+        now = time.monotonic()
+        prices, to_fetch, waiting = {}, [], {}
+        with self._lock:
+            for symbol in symbols:
+                cached = self._prices.get(symbol)
+                if cached and cached[0] > now:
+                    self.hits += 1
+                    prices[symbol] = cached[1]
+                elif symbol in self._in_flight:
+                    self.coalesced += 1
+                    waiting[symbol] = self._in_flight[symbol]
+                else:
+                    self.misses += 1
+                    to_fetch.append(symbol)
+            if to_fetch:
+                future = Future()
+                for symbol in to_fetch:
+                    self._in_flight[symbol] = future
+        if to_fetch:
+            try:
+                fetched = fetch(to_fetch)
+            except BaseException as e:
+                with self._lock:
+                    for symbol in to_fetch:
+                        del self._in_flight[symbol]
+                future.set_exception(e)
+                raise
+            expires = time.monotonic() + self.ttl_seconds
+            with self._lock:
+                for symbol in to_fetch:
+                    self._prices[symbol] = (expires, fetched[symbol])
+                    del self._in_flight[symbol]
+            future.set_result(fetched)
+            prices.update(fetched)
+        for symbol, pending in waiting.items():
+            prices[symbol] = pending.result()[symbol]
+        return prices
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "size": len(self._prices),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prices.clear()
+
+
+price_cache = PriceCache(PRICE_CACHE_TTL_SECONDS)
+_market_status = {"expires": 0.0, "open": False}
+_market_status_lock = threading.Lock()
+_replay = None
+
+
+def set_replay(replay) -> None:
+    """
+    Serve prices and market hours from a replay of historical data instead of Polygon, as a
+    backtest does; replay needs prices(symbols) -> dict and is_open() -> bool. None goes live.
+    """
+    global _replay
+    _replay = replay
+
+
+@lru_cache(maxsize=1)
+def get_client() -> RESTClient:
+    """One RESTClient per process; its urllib3 pool keeps connections to Polygon alive"""
+    return RESTClient(polygon_api_key)
+
+
+def price_cache_stats() -> dict:
+    return price_cache.stats()
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
-    return market_status.market == "open"
+    if _replay is not None:
+        return _replay.is_open()
+    with _market_status_lock:
+        if _market_status["expires"] <= time.monotonic():
+            market_status = get_client().get_market_status()
+            _market_status["open"] = market_status.market == "open"
+            _market_status["expires"] = time.monotonic() + MARKET_STATUS_TTL_SECONDS
+        return _market_status["open"]
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -33,38 +153,94 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 
+def prune_snapshots(today: str) -> None:
+    """Delete the snapshot files dated more than MARKET_SNAPSHOT_RETENTION_DAYS before today"""
+    cutoff = date.fromisoformat(today) - timedelta(days=MARKET_SNAPSHOT_RETENTION_DAYS)
+    for filename in os.listdir(MARKET_SNAPSHOT_DIR):
+        stem, extension = os.path.splitext(filename)
+        try:
+            expired = extension == ".eod" and date.fromisoformat(stem) < cutoff
+        except ValueError:
+            continue
+        if expired:
+            try:
+                os.remove(os.path.join(MARKET_SNAPSHOT_DIR, filename))
+            except FileNotFoundError:
+                pass  # another process pruned it first
+
+
 @lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+def get_market_for_prior_date(today) -> MarketSnapshot:
+    """
+    The prior close for every symbol, memory-mapped from a per-date snapshot file that is
+    written once and shared by every process; only the first process of the day parses JSON.
+    """
+    path = os.path.join(MARKET_SNAPSHOT_DIR, f"{today}.eod")
+    if not os.path.exists(path):
+        market_data = read_market(today)
+        if not market_data:
+            market_data = get_all_share_prices_polygon_eod()
+            write_market(today, market_data)
+        write_snapshot(path, market_data)
+        prune_snapshots(today)
+    return MarketSnapshot(path)
 
 
 def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
+    today = clock.now().date().strftime("%Y-%m-%d")
     market_data = get_market_for_prior_date(today)
     return market_data.get(symbol, 0.0)
 
 
-def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
-    result = client.get_snapshot_ticker("stocks", symbol)
-    return result.min.close or result.prev_day.close
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = clock.now().date().strftime("%Y-%m-%d")
+    market_data = get_market_for_prior_date(today)
+    return {symbol: market_data.get(symbol, 0.0) for symbol in symbols}
+
+
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """One multi-ticker snapshot request for the whole basket"""
+    client = get_client()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close or result.prev_day.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
 def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
+    if is_paid_polygon or is_realtime_polygon:
+        return price_cache.get_many([symbol], get_share_prices_polygon_min)[symbol]
     else:
         return get_share_price_polygon_eod(symbol)
 
 
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if is_paid_polygon or is_realtime_polygon:
+        return price_cache.get_many(symbols, get_share_prices_polygon_min)
+    else:
+        return get_share_prices_polygon_eod(symbols)
+
+
 def get_share_price(symbol) -> float:
+    if _replay is not None:
+        return _replay.prices([symbol])[symbol]
     if polygon_api_key:
         try:
             return get_share_price_polygon(symbol)
         except Exception as e:
             print(f"Was not able to use the polygon API due to {e}; using a random number")
     return float(random.randint(1, 100))
+
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """Price a whole basket of symbols in one pass rather than one lookup per symbol"""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if _replay is not None:
+        return _replay.prices(symbols)
+    if polygon_api_key:
+        try:
+            return get_share_prices_polygon(symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+    return {symbol: float(random.randint(1, 100)) for symbol in symbols}
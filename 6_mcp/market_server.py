@@ -1,8 +1,12 @@
+import asyncio
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import get_share_price, get_share_prices
 
 mcp = FastMCP("market_server")
 
+# Price lookups can block on the network, so they run in a worker thread rather than on the
+# event loop, which every trader shares when the server runs in process
+
 @mcp.tool()
 async def lookup_share_price(symbol: str) -> float:
     """This tool provides the current price of the given stock symbol.
@@ -10,7 +14,16 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await asyncio.to_thread(get_share_price, symbol)
+
+@mcp.tool()
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in a single lookup.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return await asyncio.to_thread(get_share_prices, symbols)
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
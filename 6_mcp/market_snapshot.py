@@ -0,0 +1,96 @@
+"""
+A compact, memory-mapped file holding one day's closing prices.
+
+Layout (little-endian):
+    8 bytes   magic b"EODSNAP1"
+    4 bytes   number of symbols N
+    4 bytes   symbol width W
+    N * W     symbols, ASCII, NUL-padded, sorted
+    padding   to an 8-byte boundary
+    N * 8     float64 prices, in the same order as the symbols
+
+Every process maps the same file read-only, so the OS page cache holds a single copy and a
+lookup is a binary search over the symbol index with no JSON parsing.
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+
+MAGIC = b"EODSNAP1"
+HEADER = struct.Struct("<8sII")
+SYMBOL_WIDTH = 16
+
+
+def _prices_offset(count: int, width: int) -> int:
+    end_of_symbols = HEADER.size + count * width
+    return (end_of_symbols + 7) // 8 * 8
+
+
+def write_snapshot(path: str, prices: dict[str, float]) -> None:
+    """Write prices to path atomically; symbols too long for the index are skipped."""
+    symbols = sorted(
+        symbol.encode("ascii") for symbol in prices if len(symbol.encode("ascii")) <= SYMBOL_WIDTH
+    )
+    count = len(symbols)
+    offset = _prices_offset(count, SYMBOL_WIDTH)
+    data = bytearray(offset + count * 8)
+    HEADER.pack_into(data, 0, MAGIC, count, SYMBOL_WIDTH)
+    for i, symbol in enumerate(symbols):
+        start = HEADER.size + i * SYMBOL_WIDTH
+        data[start : start + len(symbol)] = symbol
+    struct.pack_into(f"<{count}d", data, offset, *(float(prices[s.decode("ascii")]) for s in symbols))
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class MarketSnapshot:
+    """Read-only view of a snapshot file, with the dict-style lookups market.py needs."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._width = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a market snapshot")
+        offset = _prices_offset(self._count, self._width)
+        self._prices = memoryview(self._map)[offset : offset + self._count * 8].cast("d")
+
+    def _symbol_at(self, i: int) -> bytes:
+        start = HEADER.size + i * self._width
+        return self._map[start : start + self._width]
+
+    def _index(self, symbol: str) -> int:
+        key = symbol.encode("ascii", "replace").ljust(self._width, b"\0")
+        if len(key) > self._width:
+            return -1
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._symbol_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._symbol_at(low) == key:
+            return low
+        return -1
+
+    def get(self, symbol: str, default: float | None = None) -> float | None:
+        i = self._index(symbol)
+        return self._prices[i] if i >= 0 else default
+
+    def __contains__(self, symbol: str) -> bool:
+        return self._index(symbol) >= 0
+
+    def __len__(self) -> int:
+        return self._count
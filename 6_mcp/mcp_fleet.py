@@ -0,0 +1,141 @@
+import asyncio
+import time
+from agents.mcp import MCPServer
+from mcp_inprocess import MCPServerInProcess, create_mcp_server
+from mcp_params import (
+    trader_mcp_server_params,
+    researcher_shared_mcp_server_params,
+    researcher_memory_mcp_server_params,
+    memory_owner,
+)
+
+CLIENT_SESSION_TIMEOUT_SECONDS = 120
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+
+def server_name(params: dict, owner: str | None = None) -> str:
+    name = params["args"][-1]
+    return f"{name}:{owner}" if owner else name
+
+
+class MCPServerFleet:
+    """
+    The trading floor's MCP servers, started once and shared by every trader.
+
+    The accounts, push, market, fetch and search servers are stateless (the account name is a
+    tool argument), so a single instance of each serves all traders. Only the memory server,
+    which holds each trader's own knowledge graph, is started per trader (or once for all of
+    them when MEMORY_MODE is shared). Servers are checked between cycles and restarted if they
+    have crashed.
+
+    Each server is connected and cleaned up by its own host task, because the stdio client's
+    cancel scopes must be exited in the task that entered them; that also lets the servers
+    start in parallel and be restarted individually.
+    """
+
+    def __init__(self, trader_names: list[str]):
+        self.trader_names = trader_names
+        self.startup_seconds: dict[str, float] = {}
+        self.restarts: dict[str, int] = {}
+        self._params: dict[str, dict] = {}
+        self._servers: dict[str, MCPServer] = {}
+        self._hosts: dict[str, tuple[asyncio.Task, asyncio.Event]] = {}
+        self._trader_server_names = [server_name(params) for params in trader_mcp_server_params]
+        self._researcher_server_names = [
+            server_name(params) for params in researcher_shared_mcp_server_params
+        ]
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    async def _host(self, server: MCPServer, ready: asyncio.Future, stop: asyncio.Event):
+        try:
+            await server.connect()
+        except Exception as e:
+            ready.set_exception(e)
+            return
+        except BaseException:
+            ready.cancel()
+            raise
+        ready.set_result(None)
+        try:
+            await stop.wait()
+        finally:
+            await server.cleanup()
+
+    async def _start_server(self, name: str) -> None:
+        server = create_mcp_server(
+            self._params[name],
+            name=name,
+            cache_tools_list=True,
+            client_session_timeout_seconds=CLIENT_SESSION_TIMEOUT_SECONDS,
+        )
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        start = time.perf_counter()
+        task = asyncio.create_task(self._host(server, ready, stop))
+        await ready
+        self.startup_seconds[name] = time.perf_counter() - start
+        self._servers[name] = server
+        self._hosts[name] = (task, stop)
+        print(f"Started MCP server {name} in {self.startup_seconds[name]:.2f}s")
+
+    async def _stop_server(self, name: str) -> None:
+        task, stop = self._hosts.pop(name)
+        self._servers.pop(name)
+        stop.set()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def start(self) -> None:
+        for params in [*trader_mcp_server_params, *researcher_shared_mcp_server_params]:
+            self._params[server_name(params)] = params
+        for trader_name in self.trader_names:
+            params = researcher_memory_mcp_server_params(trader_name)
+            self._params[server_name(params, memory_owner(trader_name))] = params
+        results = await asyncio.gather(
+            *[self._start_server(name) for name in self._params], return_exceptions=True
+        )
+        failures = [result for result in results if isinstance(result, BaseException)]
+        if failures:
+            await self.stop()
+            raise failures[0]
+
+    async def _is_healthy(self, server: MCPServer) -> bool:
+        if isinstance(server, MCPServerInProcess):
+            return True
+        if server.session is None:
+            return False
+        try:
+            await asyncio.wait_for(server.session.send_ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+            return True
+        except Exception:
+            return False
+
+    async def ensure_healthy(self) -> None:
+        """Restart any server that no longer answers a ping."""
+        for name, server in list(self._servers.items()):
+            if not await self._is_healthy(server):
+                print(f"MCP server {name} is not responding; restarting it")
+                await self._stop_server(name)
+                self.restarts[name] = self.restarts.get(name, 0) + 1
+                await self._start_server(name)
+
+    async def stop(self) -> None:
+        await asyncio.gather(*[self._stop_server(name) for name in list(self._hosts)])
+
+    def trader_servers(self) -> list[MCPServer]:
+        return [self._servers[name] for name in self._trader_server_names]
+
+    def researcher_servers(self, trader_name: str) -> list[MCPServer]:
+        memory = server_name(researcher_memory_mcp_server_params(trader_name), memory_owner(trader_name))
+        return [self._servers[name] for name in self._researcher_server_names] + [self._servers[memory]]
+
+    def report(self) -> dict:
+        return {
+            name: {"startup_seconds": round(seconds, 3), "restarts": self.restarts.get(name, 0)}
+            for name, seconds in self.startup_seconds.items()
+        }
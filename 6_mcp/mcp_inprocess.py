@@ -0,0 +1,100 @@
+import json
+import importlib
+from typing import Any
+from agents.mcp import MCPServer, MCPServerStdio
+from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult, GetPromptResult, ListPromptsResult, TextContent, Tool as MCPTool
+from mcp_params import MCP_TRANSPORT
+from research_cache import CACHED_TOOLS, CachingMCPServer
+
+# This project's own FastMCP servers, by the script that mcp_params launches for them
+IN_PROCESS_SERVERS = {
+    "accounts_server.py": "accounts_server",
+    "market_server.py": "market_server",
+    "push_server.py": "push_server",
+    "memory_server.py": "memory_server",
+}
+
+
+class MCPServerInProcess(MCPServer):
+    """
+    One of this project's FastMCP servers mounted directly in the caller's event loop.
+
+    Tool calls go straight to the FastMCP tool manager: no subprocess, no stdio and no
+    JSON-RPC framing. The trade-off is isolation, since a tool that blocks or crashes does so
+    inside the trading floor process; set MCP_TRANSPORT=stdio to run servers out of process.
+    Servers mounted this way must be async throughout: tools that touch the database or the
+    network do that work in a worker thread (asyncio.to_thread), not on the shared event loop.
+    """
+
+    def __init__(self, server: FastMCP, name: str | None = None):
+        super().__init__()
+        self.server = server
+        self._name = name or server.name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def connect(self):
+        pass
+
+    async def cleanup(self):
+        pass
+
+    async def list_tools(self, run_context=None, agent=None) -> list[MCPTool]:
+        return await self.server.list_tools()
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any] | None) -> CallToolResult:
+        try:
+            result = await self.server.call_tool(tool_name, arguments or {})
+        except Exception as e:
+            return CallToolResult(content=[TextContent(type="text", text=str(e))], isError=True)
+        if isinstance(result, tuple):
+            content, structured = result
+        elif isinstance(result, dict):
+            content, structured = [TextContent(type="text", text=json.dumps(result, indent=2))], result
+        else:
+            content, structured = result, None
+        return CallToolResult(content=list(content), structuredContent=structured, isError=False)
+
+    async def list_prompts(self) -> ListPromptsResult:
+        return ListPromptsResult(prompts=await self.server.list_prompts())
+
+    async def get_prompt(self, name: str, arguments: dict[str, Any] | None = None) -> GetPromptResult:
+        return await self.server.get_prompt(name, arguments)
+
+
+def in_process_server(script: str, env: dict | None = None) -> FastMCP | None:
+    """
+    The FastMCP instance behind script, if it is one of ours and in-process mode is selected.
+    Servers configured by their environment, like the memory server, provide server_for_env.
+    """
+    module = IN_PROCESS_SERVERS.get(script)
+    if MCP_TRANSPORT != "inprocess" or not module:
+        return None
+    module = importlib.import_module(module)
+    if hasattr(module, "server_for_env"):
+        return module.server_for_env(env or {})
+    return module.mcp
+
+
+def create_mcp_server(params: dict, name: str | None = None, **stdio_options) -> MCPServer:
+    """
+    Mount params' server in process when possible, otherwise launch it over stdio; fetch and
+    search servers are wrapped in the shared research cache.
+    """
+    script = params["args"][-1]
+    server = in_process_server(script, params.get("env"))
+    if server:
+        return MCPServerInProcess(server, name=name)
+    server = MCPServerStdio(params, name=name, **stdio_options)
+    if script in CACHED_TOOLS:
+        return CachingMCPServer(server, CACHED_TOOLS[script])
+    return server
@@ -7,6 +7,18 @@ load_dotenv(override=True)
 brave_env = {"BRAVE_API_KEY": os.getenv("BRAVE_API_KEY")}
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 
+# "stdio" launches this project's own MCP servers as subprocesses; "inprocess" mounts them
+# directly in the trading floor's event loop. Third-party servers always use stdio.
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").strip().lower()
+if MCP_TRANSPORT not in ("stdio", "inprocess"):
+    raise ValueError(f"MCP_TRANSPORT must be stdio or inprocess, not {MCP_TRANSPORT!r}")
+
+# "per_trader" gives each trader's researcher its own knowledge graph in memory/{name}.db;
+# "shared" gives them all one graph, memory/shared.db, served by a single memory server
+MEMORY_MODE = os.getenv("MEMORY_MODE", "per_trader").strip().lower()
+if MEMORY_MODE not in ("per_trader", "shared"):
+    raise ValueError(f"MEMORY_MODE must be per_trader or shared, not {MEMORY_MODE!r}")
+
 # The MCP server for the Trader to read Market Data
 
 if is_paid_polygon or is_realtime_polygon:
@@ -28,19 +40,31 @@ trader_mcp_server_params = [
 ]
 
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
+# Fetch and Brave Search are stateless and can be shared; Memory holds each trader's own graph,
+# unless MEMORY_MODE is shared
+
+researcher_shared_mcp_server_params = [
+    {"command": "uvx", "args": ["mcp-server-fetch"]},
+    {
+        "command": "npx",
+        "args": ["-y", "@modelcontextprotocol/server-brave-search"],
+        "env": brave_env,
+    },
+]
+
+
+def memory_owner(name: str) -> str:
+    """Whose knowledge graph the named trader's researcher uses"""
+    return "shared" if MEMORY_MODE == "shared" else name
+
+
+def researcher_memory_mcp_server_params(name: str):
+    return {
+        "command": "uv",
+        "args": ["run", "memory_server.py"],
+        "env": {"MEMORY_DB": f"memory/{memory_owner(name)}.db"},
+    }
 
 
 def researcher_mcp_server_params(name: str):
-    return [
-        {"command": "uvx", "args": ["mcp-server-fetch"]},
-        {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-brave-search"],
-            "env": brave_env,
-        },
-        {
-            "command": "npx",
-            "args": ["-y", "mcp-memory-libsql"],
-            "env": {"LIBSQL_URL": f"file:./memory/{name}.db"},
-        },
-    ]
+    return [*researcher_shared_mcp_server_params, researcher_memory_mcp_server_params(name)]
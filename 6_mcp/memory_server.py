@@ -0,0 +1,497 @@
+"""
+The researchers' knowledge-graph memory: entities, the relations between them and the
+observations recorded about them, as an MCP server backed by SQLite.
+
+It offers the usual memory tools (create_entities, create_relations, add_observations, the
+deletes, read_graph, open_nodes and search_nodes) over the same tables as mcp-memory-libsql, so
+existing memory/*.db files carry over (their libsql vector index, which plain SQLite can't
+maintain, is dropped). Names, types and observations are indexed with FTS5, and
+search_nodes returns the best matches ranked by BM25, with their observations and relations,
+in one call. Relations are also held in memory as an adjacency map, reloaded only when another
+connection has written to the file.
+
+    MEMORY_DB=memory/warren.db uv run memory_server.py
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pydantic import BaseModel, ConfigDict, Field
+from mcp.server.fastmcp import FastMCP
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+MEMORY_DB = os.getenv("MEMORY_DB", "memory/shared.db")
+SEARCH_LIMIT = 10
+READ_GRAPH_LIMIT = 200
+# Words in more than this fraction of names or observations are too common to rank by
+COMMON_TERM_FRACTION = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    name TEXT PRIMARY KEY,
+    entity_type TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity_name TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (entity_name) REFERENCES entities(name)
+);
+CREATE TABLE IF NOT EXISTS relations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    relation_type TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (source) REFERENCES entities(name),
+    FOREIGN KEY (target) REFERENCES entities(name)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entities_vocab USING fts5vocab(entities_fts, 'row');
+CREATE VIRTUAL TABLE IF NOT EXISTS observations_vocab USING fts5vocab(observations_fts, 'row');
+CREATE INDEX IF NOT EXISTS idx_observations_entity ON observations(entity_name);
+CREATE INDEX IF NOT EXISTS idx_relations_source ON relations(source);
+CREATE INDEX IF NOT EXISTS idx_relations_target ON relations(target);
+CREATE TRIGGER IF NOT EXISTS entities_fts_insert AFTER INSERT ON entities BEGIN
+    INSERT INTO entities_fts(rowid, name, entity_type) VALUES (new.rowid, new.name, new.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS entities_fts_delete AFTER DELETE ON entities BEGIN
+    INSERT INTO entities_fts(entities_fts, rowid, name, entity_type) VALUES ('delete', old.rowid, old.name, old.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS entities_fts_update AFTER UPDATE ON entities BEGIN
+    INSERT INTO entities_fts(entities_fts, rowid, name, entity_type) VALUES ('delete', old.rowid, old.name, old.entity_type);
+    INSERT INTO entities_fts(rowid, name, entity_type) VALUES (new.rowid, new.name, new.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS observations_fts_insert AFTER INSERT ON observations BEGIN
+    INSERT INTO observations_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS observations_fts_delete AFTER DELETE ON observations BEGIN
+    INSERT INTO observations_fts(observations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+# mcp-memory-libsql's vector index on entities.embedding: plain SQLite has no
+# libsql_vector_idx(), so any write to entities fails while the index is there. Nothing here
+# searches by embedding, so the index and its shadow tables are dropped when a file is opened.
+LIBSQL_VECTOR_INDEX = """
+DROP INDEX IF EXISTS idx_entities_embedding;
+DROP TABLE IF EXISTS idx_entities_embedding_shadow;
+DROP TABLE IF EXISTS libsql_vector_meta_shadow;
+"""
+
+FTS_TABLES = {
+    "entities_fts": "CREATE VIRTUAL TABLE entities_fts USING fts5(name, entity_type, content='entities')",
+    "observations_fts": (
+        "CREATE VIRTUAL TABLE observations_fts USING fts5(content, content='observations', content_rowid='id')"
+    ),
+}
+
+
+class Entity(BaseModel):
+    name: str = Field(description="The name of the entity")
+    entityType: str = Field(description="The type of the entity, e.g. company, person, sector or theme")
+    observations: list[str] = Field(default=[], description="Facts about the entity")
+
+
+class Relation(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    source: str = Field(alias="from", description="The name of the entity the relation starts at")
+    target: str = Field(alias="to", description="The name of the entity the relation ends at")
+    relationType: str = Field(description="The relation, in active voice, e.g. supplies or competes_with")
+
+
+class Observations(BaseModel):
+    entityName: str = Field(description="The name of the entity")
+    contents: list[str] = Field(description="The observations to add")
+
+
+class ObservationDeletion(BaseModel):
+    entityName: str = Field(description="The name of the entity")
+    observations: list[str] = Field(description="The observations to delete")
+
+
+def _fts_term(term: str) -> str:
+    """A query word for FTS5; longer words also match as a prefix, so chip finds chips"""
+    return f'"{term}"*' if len(term) >= 4 and term.isalpha() else f'"{term}"'
+
+
+class KnowledgeGraph:
+    """One memory file: the SQLite tables and FTS5 indexes, plus the relations as an adjacency map"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self._lock = threading.RLock()
+        self._adjacency: dict[str, set[tuple[str, str, str]]] | None = None
+        self._data_version = None
+        with self._transaction() as conn:
+            for statement in _statements(LIBSQL_VECTOR_INDEX):
+                conn.execute(statement)
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table, create in FTS_TABLES.items():
+                if table not in existing:
+                    conn.execute(create)
+            for statement in _statements(SCHEMA):
+                conn.execute(statement)
+            for table in FTS_TABLES:
+                if table not in existing:
+                    conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+    @contextmanager
+    def _transaction(self):
+        """
+        One write transaction, holding the graph's lock. On error the adjacency map is dropped
+        as well as the transaction rolled back, since it may have been updated ahead of the write.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._adjacency = None
+                raise
+            self.conn.execute("COMMIT")
+
+    def _relations(self) -> dict[str, set[tuple[str, str, str]]]:
+        """The adjacency map, rebuilt when another connection has changed the file since it was read"""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._adjacency is None or version != self._data_version:
+            adjacency = {}
+            for relation in self.conn.execute("SELECT source, target, relation_type FROM relations"):
+                adjacency.setdefault(relation[0], set()).add(relation)
+                adjacency.setdefault(relation[1], set()).add(relation)
+            self._adjacency, self._data_version = adjacency, version
+        return self._adjacency
+
+    def _link(self, relation: tuple[str, str, str]) -> None:
+        for name in relation[:2]:
+            self._adjacency.setdefault(name, set()).add(relation)
+
+    def _unlink(self, relation: tuple[str, str, str]) -> None:
+        for name in relation[:2]:
+            self._adjacency.get(name, set()).discard(relation)
+
+    def _existing(self, names) -> set[str]:
+        names = list(dict.fromkeys(names))
+        found = set()
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT name FROM entities WHERE name IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return found
+
+    def _nodes(self, names: list[str]) -> dict:
+        """The named entities, in the given order, with their observations and the relations among them"""
+        entities = {}
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for name, entity_type in self.conn.execute(
+                f"SELECT name, entity_type FROM entities WHERE name IN ({placeholders})", chunk
+            ):
+                entities[name] = {"name": name, "entityType": entity_type, "observations": []}
+            for name, content in self.conn.execute(
+                f"SELECT entity_name, content FROM observations WHERE entity_name IN ({placeholders}) ORDER BY id",
+                chunk,
+            ):
+                entities[name]["observations"].append(content)
+        adjacency = self._relations()
+        relations = {
+            relation
+            for name in entities
+            for relation in adjacency.get(name, ())
+            if relation[0] in entities and relation[1] in entities
+        }
+        return {
+            "entities": [entities[name] for name in names if name in entities],
+            "relations": [
+                {"from": source, "to": target, "relationType": relation_type}
+                for source, target, relation_type in sorted(relations)
+            ],
+        }
+
+    def create_entities(self, entities: list[Entity]) -> list[dict]:
+        """Create new entities; for ones that already exist, update the type and add any new observations"""
+        with self._transaction() as conn:
+            for entity in entities:
+                conn.execute(
+                    "INSERT INTO entities (name, entity_type) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET entity_type = excluded.entity_type "
+                    "WHERE entity_type != excluded.entity_type",
+                    (entity.name, entity.entityType),
+                )
+                self._add(conn, entity.name, entity.observations)
+        return [entity.model_dump() for entity in entities]
+
+    def _add(self, conn, name: str, contents: list[str]) -> list[str]:
+        known = {row[0] for row in conn.execute("SELECT content FROM observations WHERE entity_name = ?", (name,))}
+        added = [content for content in dict.fromkeys(contents) if content not in known]
+        conn.executemany(
+            "INSERT INTO observations (entity_name, content) VALUES (?, ?)", [(name, content) for content in added]
+        )
+        return added
+
+    def create_relations(self, relations: list[Relation]) -> list[dict]:
+        """Create the relations that don't exist yet; both ends must be existing entities"""
+        with self._transaction() as conn:
+            missing = {name for r in relations for name in (r.source, r.target)} - self._existing(
+                name for r in relations for name in (r.source, r.target)
+            )
+            if missing:
+                raise ValueError(f"Create these entities before relating them: {', '.join(sorted(missing))}")
+            adjacency = self._relations()
+            created = []
+            for r in relations:
+                relation = (r.source, r.target, r.relationType)
+                if relation in adjacency.get(r.source, ()):
+                    continue
+                conn.execute("INSERT INTO relations (source, target, relation_type) VALUES (?, ?, ?)", relation)
+                self._link(relation)
+                created.append(r.model_dump(by_alias=True))
+        return created
+
+    def add_observations(self, observations: list[Observations]) -> list[dict]:
+        with self._transaction() as conn:
+            missing = {o.entityName for o in observations} - self._existing(o.entityName for o in observations)
+            if missing:
+                raise ValueError(f"Unknown entities: {', '.join(sorted(missing))}")
+            return [
+                {"entityName": o.entityName, "addedObservations": self._add(conn, o.entityName, o.contents)}
+                for o in observations
+            ]
+
+    def delete_entities(self, names: list[str]) -> None:
+        """Delete entities with their observations and every relation to or from them"""
+        with self._transaction() as conn:
+            adjacency = self._relations()
+            for name in names:
+                conn.execute("DELETE FROM observations WHERE entity_name = ?", (name,))
+                conn.execute("DELETE FROM relations WHERE source = ? OR target = ?", (name, name))
+                conn.execute("DELETE FROM entities WHERE name = ?", (name,))
+                for relation in list(adjacency.get(name, ())):
+                    self._unlink(relation)
+                adjacency.pop(name, None)
+
+    def delete_observations(self, deletions: list[ObservationDeletion]) -> None:
+        with self._transaction() as conn:
+            conn.executemany(
+                "DELETE FROM observations WHERE entity_name = ? AND content = ?",
+                [(d.entityName, content) for d in deletions for content in d.observations],
+            )
+
+    def delete_relations(self, relations: list[Relation]) -> None:
+        with self._transaction() as conn:
+            self._relations()
+            for r in relations:
+                relation = (r.source, r.target, r.relationType)
+                conn.execute("DELETE FROM relations WHERE source = ? AND target = ? AND relation_type = ?", relation)
+                self._unlink(relation)
+
+    def read_graph(self, limit: int = READ_GRAPH_LIMIT) -> dict:
+        with self._lock:
+            names = [row[0] for row in self.conn.execute(
+                "SELECT name FROM entities ORDER BY rowid DESC LIMIT ?", (limit,)
+            )]
+            return self._nodes(names)
+
+    def open_nodes(self, names: list[str]) -> dict:
+        with self._lock:
+            return self._nodes(list(dict.fromkeys(names)))
+
+    def _ranked(self, match: str, limit: int) -> list[str]:
+        """Entities matching match, by BM25 (name matches weighted highest) summed over matching rows"""
+        return [row[0] for row in self.conn.execute("""
+            WITH hits AS (
+                SELECT entities.name AS name, bm25(entities_fts, 10.0, 3.0) AS score
+                FROM entities_fts JOIN entities ON entities.rowid = entities_fts.rowid
+                WHERE entities_fts MATCH ?
+                UNION ALL
+                SELECT observations.entity_name, bm25(observations_fts)
+                FROM observations_fts JOIN observations ON observations.id = observations_fts.rowid
+                WHERE observations_fts MATCH ?
+            )
+            SELECT name FROM hits GROUP BY name ORDER BY sum(score) LIMIT ?
+        """, (match, match, limit))]
+
+    def _recent(self, match: str, limit: int) -> list[str]:
+        """Entities matching match, most recently created first, without ranking"""
+        matches = self.conn.execute("""
+            SELECT name, position FROM (
+                SELECT rowid AS position FROM entities_fts WHERE entities_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+            ) JOIN entities ON entities.rowid = position
+        """, (match, limit)).fetchall() + self.conn.execute("""
+            SELECT name, entities.rowid FROM (
+                SELECT rowid AS position FROM observations_fts WHERE observations_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+            ) JOIN observations ON observations.id = position JOIN entities ON entities.name = observations.entity_name
+        """, (match, limit * 5)).fetchall()
+        created = dict(matches)
+        return sorted(created, key=created.get, reverse=True)[:limit]
+
+    def _rows_containing(self, term: str) -> int:
+        return sum(
+            self.conn.execute(f"SELECT coalesce(sum(doc), 0) FROM {vocab} WHERE term = ?", (term,)).fetchone()[0]
+            for vocab in ("entities_vocab", "observations_vocab")
+        )
+
+    def search_nodes(self, query: str, limit: int = SEARCH_LIMIT) -> dict:
+        """
+        The entities best matching query in their name, type or observations, best first: those
+        matching every word, then those matching any of its distinctive words, each by BM25.
+        Words too common to rank by (say, "company" in a graph of companies) only narrow the
+        search; a query of nothing but common words returns the most recently created matches of
+        the least common one.
+        """
+        terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))
+        if not terms:
+            return {"entities": [], "relations": []}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT coalesce((SELECT max(rowid) FROM entities), 0) + coalesce((SELECT max(id) FROM observations), 0)"
+            ).fetchone()[0]
+            documents = {term: self._rows_containing(term) for term in terms}
+            rare = [term for term in terms if documents[term] <= rows * COMMON_TERM_FRACTION]
+            if not rare:
+                return self._nodes(self._recent(_fts_term(min(terms, key=documents.get)), limit))
+            names = self._ranked(" AND ".join(map(_fts_term, terms)), limit)
+            if len(names) < limit and len(terms) > 1:
+                for name in self._ranked(" OR ".join(map(_fts_term, rare)), limit):
+                    if name not in names and len(names) < limit:
+                        names.append(name)
+            return self._nodes(names)
+
+
+def _statements(script: str) -> list[str]:
+    """Split SCHEMA into statements, keeping each trigger body whole"""
+    statements, current = [], []
+    for line in script.strip().splitlines():
+        current.append(line)
+        joined = "\n".join(current)
+        if line.endswith(";") and sqlite3.complete_statement(joined):
+            statements.append(joined)
+            current = []
+    return statements
+
+
+_servers: dict[str, FastMCP] = {}
+
+
+def create_server(path: str) -> FastMCP:
+    """An MCP server over the memory file at path"""
+    graph = KnowledgeGraph(path)
+    mcp = FastMCP("memory_server")
+
+    @mcp.tool()
+    async def create_entities(entities: list[Entity]) -> dict:
+        """Create entities in the knowledge graph, each with a name, type and observations.
+        If an entity already exists, its type is updated and any new observations are added.
+
+        Args:
+            entities: The entities to create
+        """
+        return {"entities": graph.create_entities(entities)}
+
+    @mcp.tool()
+    async def create_relations(relations: list[Relation]) -> dict:
+        """Create relations between existing entities in the knowledge graph.
+
+        Args:
+            relations: The relations, each with from, to and relationType
+        """
+        return {"relations": graph.create_relations(relations)}
+
+    @mcp.tool()
+    async def add_observations(observations: list[Observations]) -> dict:
+        """Add observations to existing entities in the knowledge graph.
+
+        Args:
+            observations: The entity names and the observations to add to each
+        """
+        return {"results": graph.add_observations(observations)}
+
+    @mcp.tool()
+    async def delete_entities(entityNames: list[str]) -> str:
+        """Delete entities from the knowledge graph, with their observations and relations.
+
+        Args:
+            entityNames: The names of the entities to delete
+        """
+        graph.delete_entities(entityNames)
+        return "Entities deleted"
+
+    @mcp.tool()
+    async def delete_observations(deletions: list[ObservationDeletion]) -> str:
+        """Delete specific observations from entities in the knowledge graph.
+
+        Args:
+            deletions: The entity names and the observations to delete from each
+        """
+        graph.delete_observations(deletions)
+        return "Observations deleted"
+
+    @mcp.tool()
+    async def delete_relations(relations: list[Relation]) -> str:
+        """Delete relations from the knowledge graph.
+
+        Args:
+            relations: The relations to delete, each with from, to and relationType
+        """
+        graph.delete_relations(relations)
+        return "Relations deleted"
+
+    @mcp.tool()
+    async def read_graph(limit: int = READ_GRAPH_LIMIT) -> dict:
+        """Read the most recently created entities in the knowledge graph and the relations among them.
+        Prefer search_nodes to find what is relevant.
+
+        Args:
+            limit: The most entities to return
+        """
+        return graph.read_graph(limit)
+
+    @mcp.tool()
+    async def open_nodes(names: list[str]) -> dict:
+        """Read specific entities by name, with their observations and the relations among them.
+
+        Args:
+            names: The names of the entities
+        """
+        return graph.open_nodes(names)
+
+    @mcp.tool()
+    async def search_nodes(query: str, limit: int = SEARCH_LIMIT) -> dict:
+        """Search the knowledge graph for entities whose name, type or observations match any word
+        of the query. Returns the best matches first, with their observations and the relations
+        among them, in one call.
+
+        Args:
+            query: Words to search for, e.g. "semiconductor supply chain NVDA"
+            limit: The most entities to return
+        """
+        return graph.search_nodes(query, limit)
+
+    return mcp
+
+
+def server_for_env(env: dict) -> FastMCP:
+    """The in-process server for the memory file MEMORY_DB in env names, one per file"""
+    path = env.get("MEMORY_DB", MEMORY_DB)
+    if path not in _servers:
+        _servers[path] = create_server(path)
+    return _servers[path]
+
+
+if __name__ == "__main__":
+    create_server(MEMORY_DB).run(transport="stdio")
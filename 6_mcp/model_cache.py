@@ -0,0 +1,212 @@
+"""
+Record and replay agent model calls, so Trader and Researcher runs can be repeated offline.
+
+MODEL_CACHE_MODE selects the behaviour of every model handed out by traders.get_model:
+    off      call the provider as usual (the default)
+    record   call the provider and store each request/response pair
+    replay   answer from the store; on a miss, fail or fall through to the provider and
+             record the answer, as MODEL_CACHE_MISS ("fail" or "fallthrough") says
+
+Requests are keyed by a SHA-256 of the model name, instructions, input, tools, settings and
+output schema, with timestamps masked so a prompt that only differs by "the current datetime"
+still matches. The store is a SQLite file, MODEL_CACHE_DB, separate from the accounts DB.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+import dataclasses
+from datetime import datetime
+from pydantic import BaseModel, TypeAdapter
+from agents.items import ModelResponse, TResponseOutputItem
+from agents.models.interface import Model
+from agents.usage import Usage
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+MODEL_CACHE_MODE = os.getenv("MODEL_CACHE_MODE", "off").strip().lower()
+MODEL_CACHE_MISS = os.getenv("MODEL_CACHE_MISS", "fail").strip().lower()
+MODEL_CACHE_DB = os.getenv("MODEL_CACHE_DB", "model_cache.db")
+MODES = ("off", "record", "replay")
+MISS_POLICIES = ("fail", "fallthrough")
+
+if MODEL_CACHE_MODE not in MODES:
+    raise ValueError(f"MODEL_CACHE_MODE must be one of {MODES}, not {MODEL_CACHE_MODE!r}")
+if MODEL_CACHE_MISS not in MISS_POLICIES:
+    raise ValueError(f"MODEL_CACHE_MISS must be one of {MISS_POLICIES}, not {MODEL_CACHE_MISS!r}")
+
+TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?")
+OUTPUT_ITEMS = TypeAdapter(list[TResponseOutputItem])
+
+
+class ModelCacheMiss(LookupError):
+    pass
+
+
+def _jsonable(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    return str(value)
+
+
+def request_key(model_name: str, system_instructions, input, model_settings, tools, output_schema, handoffs) -> str:
+    request = {
+        "model": model_name,
+        "instructions": system_instructions,
+        "input": input,
+        "settings": model_settings.to_json_dict() if model_settings else None,
+        "tools": [
+            [getattr(tool, "name", type(tool).__name__), getattr(tool, "params_json_schema", None)]
+            for tool in tools
+        ],
+        "output_schema": output_schema.json_schema() if output_schema and not output_schema.is_plain_text() else None,
+        "handoffs": [handoff.tool_name for handoff in handoffs],
+    }
+    normalized = TIMESTAMP.sub("<timestamp>", json.dumps(request, sort_keys=True, default=_jsonable))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ModelCache:
+    """The request/response store, one SQLite connection per thread"""
+
+    def __init__(self, path: str = MODEL_CACHE_DB):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS model_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    output TEXT,
+                    usage TEXT,
+                    recorded TEXT
+                )
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> ModelResponse | None:
+        row = self._connection().execute(
+            "SELECT output, usage FROM model_responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        output = OUTPUT_ITEMS.validate_json(row[0])
+        usage = json.loads(row[1])
+        return ModelResponse(
+            output=output,
+            usage=Usage(
+                requests=usage["requests"],
+                input_tokens=usage["input_tokens"],
+                output_tokens=usage["output_tokens"],
+                total_tokens=usage["total_tokens"],
+            ),
+            response_id=None,
+        )
+
+    def put(self, key: str, model_name: str, response: ModelResponse) -> None:
+        output = json.dumps([item.model_dump(mode="json", exclude_none=True) for item in response.output])
+        usage = json.dumps({
+            "requests": response.usage.requests,
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+            "total_tokens": response.usage.total_tokens,
+        })
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_responses (key, model, output, usage, recorded) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, output, usage, datetime.now().isoformat()),
+            )
+        self.recorded += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+model_cache = ModelCache()
+
+
+class RecordReplayModel(Model):
+    """
+    Wraps the model that would otherwise be used, recording or replaying its responses.
+
+    The wrapped model is only created when a request actually has to reach the provider, so
+    a replay needs no API keys.
+    """
+
+    def __init__(self, model_name: str, factory, mode: str = MODEL_CACHE_MODE, miss: str = MODEL_CACHE_MISS, cache: ModelCache = model_cache):
+        self.model_name = model_name
+        self.factory = factory
+        self.mode = mode
+        self.miss = miss
+        self.cache = cache
+        self._model = None
+
+    @property
+    def model(self) -> Model:
+        if self._model is None:
+            self._model = self.factory()
+        return self._model
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        key = request_key(self.model_name, system_instructions, input, model_settings, tools, output_schema, handoffs)
+        if self.mode == "replay":
+            response = self.cache.get(key)
+            if response is not None:
+                return response
+            if self.miss == "fail":
+                raise ModelCacheMiss(f"No recorded response from {self.model_name} for request {key[:12]}")
+        response = await self.model.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            conversation_id=conversation_id,
+            prompt=prompt,
+        )
+        self.cache.put(key, self.model_name, response)
+        return response
+
+    def stream_response(self, *args, **kwargs):
+        """Streaming is passed straight through, neither recorded nor replayed"""
+        return self.model.stream_response(*args, **kwargs)
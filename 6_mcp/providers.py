@@ -0,0 +1,276 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Connection pool per provider, shared by every trader and researcher using it
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+# How often a 429 is waited out and retried before the error reaches the agent
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+# How often a connection error, timeout or transient server error is retried. The transport
+# owns all retries: the SDK's own are turned off so a failed call is not retried twice over
+LLM_TRANSIENT_RETRIES = int(os.getenv("LLM_TRANSIENT_RETRIES", "2"))
+TRANSIENT_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+LLM_MAX_BACKOFF_SECONDS = float(os.getenv("LLM_MAX_BACKOFF_SECONDS", "60"))
+CHARS_PER_TOKEN = 4
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+GROK_BASE_URL = "https://api.x.ai/v1"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def _limit(provider: str, limit: str) -> float:
+    """e.g. DEEPSEEK_REQUESTS_PER_MINUTE; 0 or unset means unlimited"""
+    return float(os.getenv(f"{provider.upper()}_{limit}_PER_MINUTE", "0"))
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    milliseconds = response.headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """A bucket holding up to one minute's allowance, refilled continuously; None is unlimited"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute or None
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available, 0 if it is available now"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        """
+        Spend amount, or give it back when negative. The level stays between zero and capacity,
+        so a request larger than the whole allowance (which wait_time lets through once the
+        bucket is full) can't stall the provider for minutes afterwards.
+        """
+        if self.capacity:
+            self.level = max(0.0, min(self.capacity, self.level - amount))
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider, plus a shared backoff.
+
+    Callers queue in FIFO order for both buckets. Token use is estimated from the request size
+    up front and corrected from the response's usage once it is known. A 429 blocks the whole
+    provider for its retry-after, or for an exponential backoff when the server gives none.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.consecutive_429s = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.granted = 0
+        self.tokens_used = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = None
+        self._loop = None
+
+    async def acquire(self, tokens: int) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        start = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self.blocked_until - now,
+                        self.requests.wait_time(1, now),
+                        self.tokens.wait_time(tokens, now),
+                    )
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def record_usage(self, estimated: int, actual: int | None) -> None:
+        self.consecutive_429s = 0
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+        self.tokens_used += estimated if actual is None else actual
+
+    def back_off(self, retry_after: float | None) -> float:
+        """Block the provider after a 429 and return how long for"""
+        self.rate_limited += 1
+        self.consecutive_429s += 1
+        if retry_after is None:
+            retry_after = min(LLM_MAX_BACKOFF_SECONDS, 2 ** (self.consecutive_429s - 1))
+            retry_after *= 1 + random.random() / 4
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        return retry_after
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "requests": self.granted,
+            "tokens": self.tokens_used,
+            "rate_limited": self.rate_limited,
+            "average_wait_seconds": round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+        }
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """An httpx transport that passes every request through a provider's RateLimiter"""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    async def _send(self, request: httpx.Request, estimated: int) -> httpx.Response:
+        """Send once through the limiter, retrying connection errors and transient server errors"""
+        for attempt in range(LLM_TRANSIENT_RETRIES + 1):
+            await self.limiter.acquire(estimated)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                if attempt == LLM_TRANSIENT_RETRIES:
+                    raise
+                problem = type(e).__name__
+            else:
+                if response.status_code not in TRANSIENT_STATUS_CODES or attempt == LLM_TRANSIENT_RETRIES:
+                    return response
+                await response.aclose()
+                problem = f"HTTP {response.status_code}"
+            delay = min(LLM_MAX_BACKOFF_SECONDS, 2 ** attempt) * (1 + random.random() / 4)
+            print(f"{self.limiter.name} request failed with {problem}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimated = len(request.content) // CHARS_PER_TOKEN
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            response = await self._send(request, estimated)
+            if response.status_code != 429 or attempt == LLM_RATE_LIMIT_RETRIES:
+                break
+            await response.aclose()
+            delay = self.limiter.back_off(_retry_after(response))
+            print(f"{self.limiter.name} rate limited the request; retrying in {delay:.1f}s")
+        if response.status_code == 429:
+            self.limiter.back_off(_retry_after(response))
+            return response
+        actual = None
+        if response.headers.get("content-type", "").startswith("application/json"):
+            await response.aread()
+            try:
+                actual = json.loads(response.content).get("usage", {}).get("total_tokens")
+            except (ValueError, AttributeError):
+                pass
+        self.limiter.record_usage(estimated, actual)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class Provider:
+    """An OpenAI-compatible endpoint with its own connection pool and rate limits"""
+
+    def __init__(self, name: str, base_url: str | None, api_key_env: str):
+        self.name = name
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+        self.limiter = RateLimiter(name, _limit(name, "REQUESTS"), _limit(name, "TOKENS"))
+        self._client = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Created on first use, so providers without a key don't fail at import"""
+        if self._client is None:
+            transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            )
+            http_client = httpx.AsyncClient(
+                transport=RateLimitedTransport(self.limiter, transport),
+                timeout=LLM_TIMEOUT_SECONDS,
+            )
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=os.getenv(self.api_key_env),
+                http_client=http_client,
+                max_retries=0,  # RateLimitedTransport does the retrying
+            )
+        return self._client
+
+
+PROVIDERS = {
+    "openai": Provider("openai", None, "OPENAI_API_KEY"),
+    "openrouter": Provider("openrouter", OPENROUTER_BASE_URL, "OPENROUTER_API_KEY"),
+    "deepseek": Provider("deepseek", DEEPSEEK_BASE_URL, "DEEPSEEK_API_KEY"),
+    "grok": Provider("grok", GROK_BASE_URL, "GROK_API_KEY"),
+    "gemini": Provider("gemini", GEMINI_BASE_URL, "GOOGLE_API_KEY"),
+}
+
+
+def provider_for(model_name: str) -> Provider:
+    if "/" in model_name:
+        return PROVIDERS["openrouter"]
+    for name in ("deepseek", "grok", "gemini"):
+        if name in model_name:
+            return PROVIDERS[name]
+    return PROVIDERS["openai"]
+
+
+def provider_metrics() -> dict:
+    """Live queue depth, waits and 429s for every provider that has been used"""
+    return {name: provider.limiter.metrics() for name, provider in PROVIDERS.items() if provider._client}
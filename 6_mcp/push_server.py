@@ -1,3 +1,4 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 import requests
@@ -19,11 +20,12 @@ class PushModelArgs(BaseModel):
 
 
 @mcp.tool()
-def push(args: PushModelArgs):
+async def push(args: PushModelArgs):
     """Send a push notification with this brief message"""
     print(f"Push: {args.message}")
     payload = {"user": pushover_user, "token": pushover_token, "message": args.message}
-    requests.post(pushover_url, data=payload)
+    # In a worker thread, so the request doesn't block the event loop when served in process
+    await asyncio.to_thread(requests.post, pushover_url, data=payload)
     return "Push notification sent"
 
 
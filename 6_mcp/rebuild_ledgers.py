@@ -0,0 +1,26 @@
+"""
+Check every account's stored ledger against its transaction history, and repair or migrate it.
+
+Each ledger is rebuilt by replaying the account's transactions; any stored ledger that
+disagrees is replaced. With --mode, every account is switched to that cost basis mode, since
+COST_BASIS_MODE only sets the mode of accounts created after it changes:
+
+    uv run rebuild_ledgers.py
+    uv run rebuild_ledgers.py --mode fifo
+"""
+
+import argparse
+from accounts import rebuild_ledgers
+from ledger import COST_BASIS_MODES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild account ledgers from their transactions")
+    parser.add_argument("--mode", choices=COST_BASIS_MODES, help="Switch every account to this cost basis mode")
+    args = parser.parse_args(argv)
+    for name, consistent in rebuild_ledgers(args.mode).items():
+        print(f"{name}: {'consistent' if consistent else 'rebuilt'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+A shared cache in front of the researchers' fetch and search MCP servers.
+
+Every trader's researcher goes out at the same moment with near-identical instructions, so
+they fetch the same news pages and run overlapping searches. CachingMCPServer wraps the
+upstream server and answers a repeated call from the cache for its TTL: URLs are keyed with
+the fragment and tracking parameters dropped and the query sorted, searches with the query
+case-folded and its whitespace collapsed. Identical calls made while the first is still in
+flight wait for its result rather than reaching the upstream server themselves.
+
+The cache is one module-level instance, so it is shared by every trader in the process
+whether the servers come from the MCPServerFleet or are started per trader.
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from agents.mcp import MCPServer
+from mcp.types import CallToolResult
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+RESEARCH_FETCH_TTL_SECONDS = float(os.getenv("RESEARCH_FETCH_TTL_SECONDS", "900"))
+RESEARCH_SEARCH_TTL_SECONDS = float(os.getenv("RESEARCH_SEARCH_TTL_SECONDS", "600"))
+RESEARCH_CACHE_MAX_ENTRIES = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "2000"))
+
+TRACKING_PARAMETERS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "cmpid", "guccounter"}
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMETERS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def _fetch_key(arguments: dict) -> str:
+    return repr((
+        normalize_url(arguments.get("url", "")),
+        arguments.get("max_length"),
+        arguments.get("start_index"),
+        arguments.get("raw"),
+    ))
+
+
+def _search_key(arguments: dict) -> str:
+    return repr((normalize_query(arguments.get("query", "")), arguments.get("count"), arguments.get("offset")))
+
+
+# Cacheable tools by server script: tool name -> (key function, TTL in seconds)
+CACHED_TOOLS = {
+    "mcp-server-fetch": {"fetch": (_fetch_key, RESEARCH_FETCH_TTL_SECONDS)},
+    "@modelcontextprotocol/server-brave-search": {
+        "brave_web_search": (_search_key, RESEARCH_SEARCH_TTL_SECONDS),
+        "brave_local_search": (_search_key, RESEARCH_SEARCH_TTL_SECONDS),
+    },
+}
+
+
+class ResearchCache:
+    """Results by (tool, normalized arguments) with a TTL and LRU eviction, plus in-flight calls"""
+
+    def __init__(self, max_entries: int = RESEARCH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple[float, CallToolResult]] = OrderedDict()
+        self._in_flight: dict[tuple[str, str], asyncio.Future] = {}
+        self._cycle = self._counters()
+        self._total = self._counters()
+
+    @staticmethod
+    def _counters() -> dict[str, int]:
+        return {"hits": 0, "coalesced": 0, "misses": 0, "errors": 0}
+
+    def _count(self, outcome: str) -> None:
+        self._cycle[outcome] += 1
+        self._total[outcome] += 1
+
+    async def call(self, key: tuple[str, str], ttl: float, call) -> CallToolResult:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("hits")
+                return entry[1]
+            del self._entries[key]
+        if key in self._in_flight:
+            self._count("coalesced")
+            in_flight = self._in_flight[key]
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+                return await self.call(key, ttl, call)  # the first caller was cancelled, not us
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self._count("misses")
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            self._count("errors")
+            future.set_exception(e)
+            future.exception()  # mark retrieved, in case nobody else was waiting
+            raise
+        finally:
+            del self._in_flight[key]
+        if result.isError:
+            self._count("errors")
+        else:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    @staticmethod
+    def _rates(counters: dict[str, int]) -> dict:
+        calls = counters["hits"] + counters["coalesced"] + counters["misses"]
+        saved = counters["hits"] + counters["coalesced"]
+        return {**counters, "calls": calls, "hit_rate": round(saved / calls, 3) if calls else 0.0}
+
+    def end_cycle(self) -> dict:
+        """This cycle's counts and hit rate (hits and coalesced calls over all calls), then reset them"""
+        stats = {**self._rates(self._cycle), "entries": len(self._entries)}
+        self._cycle = self._counters()
+        return stats
+
+    def stats(self) -> dict:
+        return {**self._rates(self._total), "entries": len(self._entries)}
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+research_cache = ResearchCache()
+
+
+class CachingMCPServer(MCPServer):
+    """An MCP server that answers the cacheable tools of the server it wraps from research_cache"""
+
+    def __init__(self, server: MCPServer, tools: dict, cache: ResearchCache = research_cache):
+        super().__init__(use_structured_content=server.use_structured_content)
+        self.server = server
+        self.tools = tools
+        self.cache = cache
+
+    @property
+    def name(self) -> str:
+        return self.server.name
+
+    @property
+    def session(self):
+        """The wrapped server's client session, for the fleet's health checks"""
+        return getattr(self.server, "session", None)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.cleanup()
+
+    async def connect(self):
+        await self.server.connect()
+
+    async def cleanup(self):
+        await self.server.cleanup()
+
+    async def list_tools(self, run_context=None, agent=None):
+        return await self.server.list_tools(run_context, agent)
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any] | None) -> CallToolResult:
+        if tool_name not in self.tools:
+            return await self.server.call_tool(tool_name, arguments)
+        key_function, ttl = self.tools[tool_name]
+        key = (tool_name, key_function(arguments or {}))
+        return await self.cache.call(key, ttl, lambda: self.server.call_tool(tool_name, arguments))
+
+    async def list_prompts(self):
+        return await self.server.list_prompts()
+
+    async def get_prompt(self, name: str, arguments: dict[str, Any] | None = None):
+        return await self.server.get_prompt(name, arguments)
@@ -1,4 +1,4 @@
-from accounts import Account
+from accounts import update_account
 
 waren_strategy = """
 You are Warren, and you are named in homage to your role model, Warren Buffett.
@@ -40,10 +40,10 @@ You focus your trading on crypto ETFs.
 
 
 def reset_traders():
-    Account.get("Warren").reset(waren_strategy)
-    Account.get("George").reset(george_strategy)
-    Account.get("Ray").reset(ray_strategy)
-    Account.get("Cathie").reset(cathie_strategy)
+    update_account("Warren", lambda account: account.reset(waren_strategy))
+    update_account("George", lambda account: account.reset(george_strategy))
+    update_account("Ray", lambda account: account.reset(ray_strategy))
+    update_account("Cathie", lambda account: account.reset(cathie_strategy))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from tracers import write_log
+
+RUN_HISTORY = 500
+
+
+@dataclass
+class RunRecord:
+    name: str
+    scheduled: float
+    started: float | None = None
+    ended: float | None = None
+    status: str = "pending"
+
+    @property
+    def lateness(self) -> float | None:
+        return None if self.started is None else self.started - self.scheduled
+
+    @property
+    def duration(self) -> float | None:
+        return None if self.ended is None or self.started is None else self.ended - self.started
+
+
+def _percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class FixedRateScheduler:
+    """
+    Runs a set of named jobs on fixed-rate ticks, so the period never drifts with run time.
+
+    Tick k of job i is due at start + offset_i + k * interval, measured on the monotonic
+    clock; ticks missed entirely (say, while the machine slept) are skipped, not replayed in
+    a burst. Each run is its own task, so a slow job never delays the others. At most
+    max_concurrency runs execute at once, each run is cancelled after timeout seconds, and a
+    job whose previous run is still going when its next tick arrives skips that tick.
+
+    Every run is recorded with its scheduled, start and end times and an outcome (ok, error,
+    timeout, cancelled, overlap, skipped or missed); summary() reports lateness percentiles
+    and counts, and each finished run is also written to the trader's log.
+    """
+
+    def __init__(
+        self,
+        jobs: dict[str, callable],
+        interval: float,
+        max_concurrency: int | None = None,
+        timeout: float | None = None,
+        stagger: float = 0.0,
+        should_run=None,
+        before_tick=None,
+    ):
+        self.jobs = jobs
+        self.interval = interval
+        self.timeout = timeout
+        self.offsets = {name: i * stagger for i, name in enumerate(jobs)}
+        self.should_run = should_run
+        self.before_tick = before_tick
+        self.records: deque[RunRecord] = deque(maxlen=RUN_HISTORY)
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._running: dict[str, asyncio.Task] = {}
+
+    async def _execute(self, record: RunRecord, job) -> None:
+        record.started = time.monotonic()
+        try:
+            if self.timeout:
+                await asyncio.wait_for(job(), self.timeout)
+            else:
+                await job()
+            record.status = "ok"
+        except asyncio.TimeoutError:
+            record.status = "timeout"
+        except asyncio.CancelledError:
+            record.status = "cancelled"
+            raise
+        except Exception as e:
+            record.status = "error"
+            print(f"Scheduled run of {record.name} failed: {e}")
+        finally:
+            record.ended = time.monotonic()
+            write_log(
+                record.name,
+                "schedule",
+                f"Run {record.status}: started {record.lateness:.1f}s late, took {record.duration:.1f}s",
+            )
+
+    async def _run_job(self, name: str, scheduled: float) -> None:
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        record = RunRecord(name, scheduled)
+        self.records.append(record)
+        if self._semaphore is None:
+            await self._execute(record, self.jobs[name])
+        else:
+            async with self._semaphore:
+                await self._execute(record, self.jobs[name])
+
+    def _launch(self, name: str, scheduled: float) -> None:
+        running = self._running.get(name)
+        if running is not None and not running.done():
+            self.records.append(RunRecord(name, scheduled, status="overlap"))
+            print(f"{name} is still running from its last tick; skipping this one")
+            return
+        self._running[name] = asyncio.create_task(self._run_job(name, scheduled))
+
+    async def run(self, ticks: int | None = None) -> None:
+        """Tick until cancelled, or for the given number of ticks"""
+        start = time.monotonic()
+        tick = 0
+        try:
+            while ticks is None or tick < ticks:
+                due = start + tick * self.interval
+                if self.should_run is None or self.should_run():
+                    if self.before_tick is not None:
+                        # A failed health check or report mustn't stop the schedule, so the
+                        # tick's runs still go ahead
+                        try:
+                            await self.before_tick()
+                        except Exception as e:
+                            print(f"Before-tick hook failed: {e}")
+                    for name in self.jobs:
+                        self._launch(name, due + self.offsets[name])
+                else:
+                    self.records.extend(RunRecord(name, due, status="skipped") for name in self.jobs)
+                    print("Market is closed, skipping run")
+                tick += 1
+                next_tick = max(tick, int((time.monotonic() - start) // self.interval) + 1)
+                missed = next_tick - tick
+                if missed:
+                    self.records.extend(
+                        RunRecord(name, start + (tick + i) * self.interval, status="missed")
+                        for i in range(missed)
+                        for name in self.jobs
+                    )
+                tick = next_tick
+                await asyncio.sleep(max(0.0, start + tick * self.interval - time.monotonic()))
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        finally:
+            for task in self._running.values():
+                task.cancel()
+
+    def summary(self) -> dict:
+        finished = [record for record in self.records if record.ended is not None]
+        lateness = [record.lateness for record in finished]
+        durations = [record.duration for record in finished]
+        statuses = {}
+        for record in self.records:
+            statuses[record.status] = statuses.get(record.status, 0) + 1
+        return {
+            "runs": len(finished),
+            "statuses": statuses,
+            "lateness_p50": _percentile(lateness, 0.5),
+            "lateness_p99": _percentile(lateness, 0.99),
+            "lateness_max": max(lateness, default=None),
+            "duration_p50": _percentile(durations, 0.5),
+            "duration_max": max(durations, default=None),
+        }
+
+    def history(self, name: str | None = None) -> list[dict]:
+        return [
+            {**asdict(record), "lateness": record.lateness, "duration": record.duration}
+            for record in self.records
+            if name is None or record.name == name
+        ]
@@ -0,0 +1,122 @@
+"""
+Stand-ins for an LLM that drive real agents through the real MCP tools by a script, so the
+backtest and the load test exercise the trading floor without calling any model API.
+
+A ScriptedModel subclass implements respond(), which turns the conversation so far into the
+output items of the next turn: tool calls, or a final message. The base class serves that
+turn both to Runner.run and, as a completed response event, to Runner.run_streamed.
+"""
+
+import json
+import time
+from abc import abstractmethod
+from collections.abc import AsyncIterator
+from agents.items import ModelResponse, TResponseInputItem, TResponseOutputItem, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+)
+
+
+def tool_call(call_id: str, tool: str, **arguments) -> ResponseFunctionToolCall:
+    return ResponseFunctionToolCall(
+        id=call_id, call_id=call_id, name=tool, arguments=json.dumps(arguments), type="function_call"
+    )
+
+
+def message(text: str) -> ResponseOutputMessage:
+    return ResponseOutputMessage(
+        id="msg_final",
+        content=[ResponseOutputText(text=text, type="output_text", annotations=[])],
+        role="assistant",
+        status="completed",
+        type="message",
+    )
+
+
+def tool_result(output: str):
+    """Decode an MCP tool output as the agents SDK hands it back to the model"""
+    try:
+        result = json.loads(output)
+    except (TypeError, ValueError):
+        return output
+    if isinstance(result, dict) and result.get("type") == "text":
+        try:
+            return json.loads(result["text"])
+        except ValueError:
+            return result["text"]
+    return result
+
+
+def tool_history(input: str | list[TResponseInputItem]) -> tuple[dict[str, str], dict[str, object]]:
+    """The tools called so far by call id, and the decoded result of each by tool name"""
+    items = [item for item in input if isinstance(item, dict)] if isinstance(input, list) else []
+    names = {item["call_id"]: item["name"] for item in items if item.get("type") == "function_call"}
+    results = {
+        names[item["call_id"]]: tool_result(item["output"])
+        for item in items
+        if item.get("type") == "function_call_output" and item["call_id"] in names
+    }
+    return names, results
+
+
+class ScriptedModel(Model):
+    """A Model whose every turn is decided by respond(); requests counts the turns served"""
+
+    requests = 0
+
+    @abstractmethod
+    def respond(self, input: str | list[TResponseInputItem]) -> list[TResponseOutputItem]:
+        """The output items of the next turn, given the conversation so far"""
+
+    def _turn(self, input) -> list[TResponseOutputItem]:
+        self.requests += 1
+        return self.respond(input)
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        return ModelResponse(output=self._turn(input), usage=Usage(requests=1), response_id=None)
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        response = Response(
+            id="resp_scripted",
+            created_at=time.time(),
+            model="scripted",
+            object="response",
+            output=self._turn(input),
+            parallel_tool_calls=True,
+            tool_choice="auto",
+            tools=[],
+            status="completed",
+        )
+        yield ResponseCompletedEvent(response=response, type="response.completed", sequence_number=0)
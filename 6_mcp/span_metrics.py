@@ -0,0 +1,138 @@
+"""
+Where the trading floor's time goes: latency histograms over the spans the LogTracer records.
+
+Every span a trader's run opens (agent turns, model generations and responses, tool calls,
+MCP tool listings) is stored in the span_metrics table with its duration. This module groups
+them per trader and per span type and label (the tool, MCP server or model) into histograms,
+for the dashboard and for export:
+
+    uv run span_metrics.py --hours 24
+    uv run span_metrics.py --hours 1 --format prometheus
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from database import SPAN_METRIC_COLUMNS, read_span_metrics
+
+load_dotenv(override=True)
+
+SPAN_WINDOW_HOURS = float(os.getenv("SPAN_WINDOW_HOURS", "24"))
+# Histogram bucket upper bounds in milliseconds, Prometheus style (cumulative, plus +Inf)
+BUCKETS_MS = (10, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 30_000, 60_000, 120_000)
+# Agent spans enclose the others, so they are left out of the breakdown of where time went
+ENCLOSING_SPAN_TYPES = ("agent",)
+
+
+def load(hours: float = SPAN_WINDOW_HOURS, name: str | None = None) -> pd.DataFrame:
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+    frame = pd.DataFrame(read_span_metrics(since, name), columns=list(SPAN_METRIC_COLUMNS))
+    frame["label"] = frame["label"].fillna("")
+    for column in ("input_tokens", "output_tokens"):
+        frame[column] = frame[column].astype(float).fillna(0).astype(int)
+    return frame
+
+
+def histograms(frame: pd.DataFrame, by: list[str]) -> list[dict]:
+    """Count, sum, percentiles and cumulative bucket counts of duration_ms for each group"""
+    results = []
+    for keys, group in frame.groupby(by, sort=True):
+        durations = group["duration_ms"].to_numpy()
+        cumulative = np.searchsorted(np.sort(durations), BUCKETS_MS, side="right")
+        results.append({
+            **dict(zip(by, keys)),
+            "count": len(durations),
+            "errors": int(group["error"].sum()),
+            "sum_ms": round(float(durations.sum()), 3),
+            "p50_ms": round(float(np.percentile(durations, 50)), 3),
+            "p95_ms": round(float(np.percentile(durations, 95)), 3),
+            "max_ms": round(float(durations.max()), 3),
+            "input_tokens": int(group["input_tokens"].sum()),
+            "output_tokens": int(group["output_tokens"].sum()),
+            "buckets": {**{str(bound): int(count) for bound, count in zip(BUCKETS_MS, cumulative)}, "+Inf": len(durations)},
+        })
+    return results
+
+
+def to_json(hours: float = SPAN_WINDOW_HOURS, name: str | None = None) -> str:
+    frame = load(hours, name)
+    return json.dumps({
+        "window_hours": hours,
+        "spans": len(frame),
+        "by_trader": histograms(frame, ["name", "span_type", "label"]),
+        "by_span": histograms(frame, ["span_type", "label"]),
+    }, indent=2)
+
+
+def _labels(**labels) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+
+
+def to_prometheus(hours: float = SPAN_WINDOW_HOURS, name: str | None = None) -> str:
+    """The histograms in the Prometheus text exposition format, durations in seconds"""
+    frame = load(hours, name)
+    metric = "trading_floor_span_duration_seconds"
+    lines = [
+        f"# HELP {metric} Duration of trader spans over the last {hours:g} hours",
+        f"# TYPE {metric} histogram",
+    ]
+    tokens = []
+    for h in histograms(frame, ["name", "span_type", "label"]):
+        labels = _labels(trader=h["name"], type=h["span_type"], label=h["label"])
+        for bound, count in h["buckets"].items():
+            le = bound if bound == "+Inf" else f"{int(bound) / 1000:g}"
+            lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+        lines.append(f"{metric}_sum{{{labels}}} {h['sum_ms'] / 1000:g}")
+        lines.append(f"{metric}_count{{{labels}}} {h['count']}")
+        for direction in ("input", "output"):
+            if h[f"{direction}_tokens"]:
+                tokens.append(
+                    f'trading_floor_tokens{{{labels},direction="{direction}"}} {h[f"{direction}_tokens"]}'
+                )
+    if tokens:
+        lines += ["# HELP trading_floor_tokens Model tokens used by trader spans", "# TYPE trading_floor_tokens gauge"]
+        lines += tokens
+    return "\n".join(lines) + "\n"
+
+
+def time_breakdown(names: list[str], hours: float = SPAN_WINDOW_HOURS) -> pd.DataFrame:
+    """
+    One row per span type and label, largest share of time first: calls, share of all span
+    time, p50 and p95 latency, then the seconds each trader spent in it.
+    """
+    frame = load(hours)
+    frame = frame[~frame["span_type"].isin(ENCLOSING_SPAN_TYPES)]
+    if frame.empty:
+        return pd.DataFrame()
+    frame = frame.assign(span=frame["span_type"] + " " + frame["label"])
+    grouped = frame.groupby("span")["duration_ms"]
+    table = pd.DataFrame({
+        "Calls": grouped.count(),
+        "Share": (grouped.sum() / frame["duration_ms"].sum() * 100).map("{:.0f}%".format),
+        "p50 (ms)": grouped.median().round(0),
+        "p95 (ms)": grouped.quantile(0.95).round(0),
+    })
+    per_trader = frame.pivot_table(index="span", columns="name", values="duration_ms", aggfunc="sum", fill_value=0)
+    per_trader = (per_trader.reindex(columns=[name.lower() for name in names], fill_value=0) / 1000).round(1)
+    per_trader.columns = [f"{name} (s)" for name in names]
+    table = table.join(per_trader).loc[grouped.sum().sort_values(ascending=False).index]
+    return table.rename_axis("Span").reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Span latency histograms from the trading floor tracer")
+    parser.add_argument("--hours", type=float, default=SPAN_WINDOW_HOURS)
+    parser.add_argument("--trader", help="Only this trader's spans")
+    parser.add_argument("--format", choices=["json", "prometheus"], default="json")
+    args = parser.parse_args(argv)
+    export = to_prometheus if args.format == "prometheus" else to_json
+    print(export(args.hours, args.trader), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from database import transaction, write_logs, write_span_metrics
+from datetime import datetime, timezone
+import atexit
+import os
+import queue
 import secrets
 import string
+import threading
+import time
 
 ALPHANUM = string.ascii_lowercase + string.digits 
 
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+LOG_FLUSH_MAX_ROWS = int(os.getenv("LOG_FLUSH_MAX_ROWS", "500"))
+
 def make_trace_id(tag: str) -> str:
     """
     Return a string of the form 'trace_<tag><random>',
@@ -15,7 +24,129 @@ def make_trace_id(tag: str) -> str:
     random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
     return f"trace_{tag}{random_suffix}"
 
+class BufferedLogWriter:
+    """
+    Queues log entries and span durations in memory and batch-inserts them from a background thread.
+
+    write() and write_span() only append to a queue, so tracing callbacks never touch SQLite on
+    the event loop. The writer thread inserts everything queued so far in one transaction every
+    LOG_FLUSH_INTERVAL_MS, or as soon as LOG_FLUSH_MAX_ROWS entries are waiting.
+    """
+
+    _STOP = object()
+
+    def __init__(self, interval_ms: int = LOG_FLUSH_INTERVAL_MS, max_rows: int = LOG_FLUSH_MAX_ROWS):
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def write(self, name: str, type: str, message: str) -> None:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._ensure_started()
+        self._queue.put(("log", (name, now, type, message)))
+
+    def write_span(self, entry: tuple) -> None:
+        """Queue one span duration, a tuple in database.SPAN_METRIC_COLUMNS order"""
+        self._ensure_started()
+        self._queue.put(("span", entry))
+
+    def _write_batch(self, batch):
+        if batch:
+            try:
+                with transaction():
+                    write_logs([entry for kind, entry in batch if kind == "log"])
+                    write_span_metrics([entry for kind, entry in batch if kind == "span"])
+                self.batches += 1
+                self.rows += len(batch)
+            except Exception as e:
+                print(f"Failed to write {len(batch)} log entries: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, deadline = [], time.monotonic() + self.interval
+            while True:
+                if item is self._STOP:
+                    self._write_batch(batch)
+                    return
+                if isinstance(item, threading.Event):
+                    self._write_batch(batch)
+                    batch = []
+                    item.set()
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_rows:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Block until every entry written before this call is in the database"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+
+log_writer = BufferedLogWriter()
+write_log = log_writer.write
+
+
+def _span_details(span) -> tuple[str | None, str | None, str | None, int | None, int | None]:
+    """The (label, server, model, input tokens, output tokens) of a span, where they apply"""
+    data = span.span_data
+    label = getattr(data, "name", None)
+    server = getattr(data, "server", None)
+    model = input_tokens = output_tokens = None
+    if data.type == "function" and data.mcp_data:
+        server = data.mcp_data.get("server")
+    elif data.type == "mcp_tools":
+        label = server
+    elif data.type == "handoff":
+        label = data.to_agent
+    elif data.type == "generation":
+        model = data.model
+        usage = data.usage or {}
+        input_tokens, output_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    elif data.type == "response" and data.response is not None:
+        model = data.response.model
+        if data.response.usage is not None:
+            input_tokens = data.response.usage.input_tokens
+            output_tokens = data.response.usage.output_tokens
+    if data.type in ("generation", "response"):
+        label = model
+    return label, server, model, input_tokens, output_tokens
+
+
 class LogTracer(TracingProcessor):
+    """
+    Writes trace and span events to each trader's log, and the duration of every span to
+    span_metrics with its type, tool or server name, model and token usage, for span_metrics.py.
+    """
+
+    def __init__(self):
+        self._started: dict[str, tuple[float, str]] = {}
 
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
         trace_id = trace_or_span.trace_id
@@ -50,6 +181,9 @@ class LogTracer(TracingProcessor):
             if span.error:
                 message += f" {span.error}"
             write_log(name, type, message)
+            self._started[span.span_id] = (
+                time.perf_counter(), datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            )
 
     def on_span_end(self, span) -> None:
         name = self.get_name(span)
@@ -67,9 +201,17 @@ class LogTracer(TracingProcessor):
             if span.error:
                 message += f" {span.error}"
             write_log(name, type, message)
+            started = self._started.pop(span.span_id, None)
+            if started and span.span_data:
+                duration_ms = (time.perf_counter() - started[0]) * 1000
+                label, server, model, input_tokens, output_tokens = _span_details(span)
+                log_writer.write_span((
+                    name, span.trace_id, type, label, server, model,
+                    input_tokens, output_tokens, started[1], duration_ms, int(span.error is not None),
+                ))
 
     def force_flush(self) -> None:
-        pass
+        log_writer.flush()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        log_writer.shutdown()
\ No newline at end of file
@@ -1,12 +1,8 @@
 from contextlib import AsyncExitStack
-from accounts_client import read_accounts_resource, read_strategy_resource
+from accounts_client import read_account_summary_resource, read_strategy_resource
 from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, OpenAIResponsesModel, trace
 from dotenv import load_dotenv
-import os
-import json
-from agents.mcp import MCPServerStdio
 from templates import (
     researcher_instructions,
     trader_instructions,
@@ -15,38 +11,26 @@ from templates import (
     research_tool,
 )
 from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+from mcp_fleet import MCPServerFleet
+from mcp_inprocess import create_mcp_server
+from providers import provider_for
+from model_cache import MODEL_CACHE_MODE, RecordReplayModel
 
 load_dotenv(override=True)
 
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-google_api_key = os.getenv("GOOGLE_API_KEY")
-grok_api_key = os.getenv("GROK_API_KEY")
-openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-
-DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
-GROK_BASE_URL = "https://api.x.ai/v1"
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
-
 
 def get_model(model_name: str):
-    if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
-    elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
-    elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
-    elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
-        return model_name
+    """
+    Models share their provider's connection pool and rate limiter (see providers.py), and
+    are wrapped for recording or replay when MODEL_CACHE_MODE is set (see model_cache.py)
+    """
+    provider = provider_for(model_name)
+    model_class = OpenAIResponsesModel if provider.name == "openai" else OpenAIChatCompletionsModel
+    if MODEL_CACHE_MODE == "off":
+        return model_class(model=model_name, openai_client=provider.client)
+    return RecordReplayModel(model_name, lambda: model_class(model=model_name, openai_client=provider.client))
 
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
@@ -84,10 +68,7 @@ class Trader:
         return self.agent
 
     async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        return await read_account_summary_resource(self.name)
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
         self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
@@ -104,28 +85,38 @@ class Trader:
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
                 await stack.enter_async_context(
-                    MCPServerStdio(params, client_session_timeout_seconds=120)
+                    create_mcp_server(params, client_session_timeout_seconds=120)
                 )
                 for params in trader_mcp_server_params
             ]
             async with AsyncExitStack() as stack:
                 researcher_mcp_servers = [
                     await stack.enter_async_context(
-                        MCPServerStdio(params, client_session_timeout_seconds=120)
+                        create_mcp_server(params, client_session_timeout_seconds=120)
                     )
                     for params in researcher_mcp_server_params(self.name)
                 ]
                 await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
-    async def run_with_trace(self):
+    async def run_with_fleet(self, fleet: MCPServerFleet):
+        await self.run_agent(fleet.trader_servers(), fleet.researcher_servers(self.name))
+
+    async def run_with_trace(self, fleet: MCPServerFleet | None = None):
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
         with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
-
-    async def run(self):
+            if fleet:
+                await self.run_with_fleet(fleet)
+            else:
+                await self.run_with_mcp_servers()
+
+    async def run(self, fleet: MCPServerFleet | None = None):
+        """
+        One trading or rebalancing run, alternating between the two. Errors, timeouts and
+        cancellation reach the caller (the scheduler records them), and the alternation still
+        moves on.
+        """
         try:
-            await self.run_with_trace()
-        except Exception as e:
-            print(f"Error running trader {self.name}: {e}")
-        self.do_trade = not self.do_trade
+            await self.run_with_trace(fleet)
+        finally:
+            self.do_trade = not self.do_trade
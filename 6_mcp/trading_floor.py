@@ -4,6 +4,11 @@ import asyncio
 from tracers import LogTracer
 from agents import add_trace_processor
 from market import is_market_open
+from accounts_client import accounts_client
+from mcp_fleet import MCPServerFleet
+from scheduler import FixedRateScheduler
+from providers import provider_metrics
+from research_cache import research_cache
 from dotenv import load_dotenv
 import os
 
@@ -13,6 +18,11 @@ RUN_EVERY_N_MINUTES = int(os.getenv("RUN_EVERY_N_MINUTES", "60"))
 RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
+# Runs start on fixed-rate ticks; each trader may be offset from the tick by STAGGER_SECONDS
+# times its position, and is cancelled after TRADER_TIMEOUT_MINUTES (default: the interval)
+MAX_CONCURRENT_TRADERS = int(os.getenv("MAX_CONCURRENT_TRADERS", "0")) or None
+TRADER_TIMEOUT_MINUTES = float(os.getenv("TRADER_TIMEOUT_MINUTES", str(RUN_EVERY_N_MINUTES)))
+STAGGER_SECONDS = float(os.getenv("STAGGER_SECONDS", "0"))
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
 
 names = ["Warren", "George", "Ray", "Cathie"]
@@ -41,12 +51,25 @@ def create_traders() -> List[Trader]:
 async def run_every_n_minutes():
     add_trace_processor(LogTracer())
     traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    async with accounts_client, MCPServerFleet(names) as fleet:
+        print(f"MCP server fleet started: {fleet.report()}")
+
+        async def before_tick():
+            print(f"Schedule health: {scheduler.summary()}")
+            print(f"LLM providers: {provider_metrics()}")
+            print(f"Research cache, last cycle: {research_cache.end_cycle()}")
+            await fleet.ensure_healthy()
+
+        scheduler = FixedRateScheduler(
+            {trader.name: lambda trader=trader: trader.run(fleet) for trader in traders},
+            interval=RUN_EVERY_N_MINUTES * 60,
+            max_concurrency=MAX_CONCURRENT_TRADERS,
+            timeout=TRADER_TIMEOUT_MINUTES * 60,
+            stagger=STAGGER_SECONDS,
+            should_run=lambda: RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open(),
+            before_tick=before_tick,
+        )
+        await scheduler.run()
 
 
 if __name__ == "__main__":